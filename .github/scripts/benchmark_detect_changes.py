@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Benchmark detect_changes.py against a synthetic repository.
+
+Generates a temporary git repo with a live/ tree and a matching
+resource-definitions.yml, commits a base state, applies a head commit with
+modified, added, deleted and renamed units, then times each stage of
+change detection. Results are written as JSON so runs can be compared
+for regressions.
+
+Usage:
+    python3 .github/scripts/benchmark_detect_changes.py --units 10000 --changed 5000 --output bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import detect_changes  # noqa: E402
+
+
+def git(repo: str, *args: str):
+    subprocess.check_call(['git', *args], cwd=repo, stdout=subprocess.DEVNULL)
+
+def write_file(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+def generate_definitions(types: int, rng: random.Random) -> Dict[str, Any]:
+    """Build resource definitions with a random dependency DAG over the types."""
+    resources = {}
+    for i in range(types):
+        name = f"type-{i:03d}"
+        candidates = [f"type-{j:03d}" for j in range(i)]
+        deps = rng.sample(candidates, min(len(candidates), rng.randint(0, 3)))
+        resources[name] = {
+            'dependencies': deps,
+            'path_pattern': f"live/**/{name}/**",
+            'exclude_pattern': f"live/**/{name}/**/README.md",
+            'template_path': f"_common/templates/{name}",
+            'emoji': '',
+            'name': name.title(),
+            'description': f"Synthetic resource {name}",
+        }
+    return {'resources': resources}
+
+def unit_path(index: int, types: int) -> str:
+    env = index % 4
+    project = (index // 4) % 50
+    r_type = index % types
+    return f"live/env-{env}/project-{project:02d}/type-{r_type:03d}/unit-{index:05d}"
+
+def generate_repo(repo: str, units: int, types: int, changed: int, templates: int,
+                  rng: random.Random) -> Dict[str, int]:
+    """Create the base commit and a head commit touching `changed` files."""
+    git(repo, 'init', '-q')
+    git(repo, 'config', 'user.email', 'bench@example.com')
+    git(repo, 'config', 'user.name', 'bench')
+    git(repo, 'config', 'commit.gpgsign', 'false')
+
+    definitions = generate_definitions(types, rng)
+    definitions_path = os.path.join(repo, 'resource-definitions.yml')
+    with open(definitions_path, 'w', encoding='utf-8') as f:
+        detect_changes.yaml.safe_dump(definitions, f, sort_keys=False)
+
+    for i in range(units):
+        base = os.path.join(repo, unit_path(i, types))
+        write_file(os.path.join(base, 'terragrunt.hcl'), f'inputs = {{\n  name = "unit-{i}"\n}}\n')
+        write_file(os.path.join(base, 'variables.auto.tfvars'), f'index = {i}\n')
+    for i in range(types):
+        write_file(os.path.join(repo, f"_common/templates/type-{i:03d}/main.hcl"), '# template\n')
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-q', '-m', 'base')
+
+    # Split the change budget: 80% modify, 10% add, 5% delete, 5% rename
+    counts = {'modified': 0, 'added': 0, 'deleted': 0, 'renamed': 0}
+    touched = rng.sample(range(units), min(units, changed))
+    for n, i in enumerate(touched):
+        bucket = n % 20
+        base = os.path.join(repo, unit_path(i, types))
+        if bucket < 16:
+            with open(os.path.join(base, 'variables.auto.tfvars'), 'a', encoding='utf-8') as f:
+                f.write('changed = true\n')
+            counts['modified'] += 1
+        elif bucket < 18:
+            new_base = os.path.join(repo, unit_path(units + n, types))
+            write_file(os.path.join(new_base, 'terragrunt.hcl'), 'inputs = {}\n')
+            counts['added'] += 1
+        elif bucket < 19:
+            shutil.rmtree(base)
+            counts['deleted'] += 1
+        else:
+            git(repo, 'mv', unit_path(i, types), unit_path(i, types) + '-moved')
+            counts['renamed'] += 1
+
+    for i in rng.sample(range(types), min(types, templates)):
+        with open(os.path.join(repo, f"_common/templates/type-{i:03d}/main.hcl"), 'a', encoding='utf-8') as f:
+            f.write('# changed\n')
+    counts['templates'] = min(types, templates)
+
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-q', '-m', 'head')
+    return counts
+
+def timed(timings: Dict[str, float], stage: str, func: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[stage] = round(time.perf_counter() - start, 6)
+    return result
+
+def run_detection(definitions_path: str, timings: Dict[str, float]) -> Dict[str, int]:
+    """Run the detect_changes pipeline stage by stage inside the current directory."""
+    definitions = timed(timings, 'load_definitions', detect_changes.load_resource_definitions, definitions_path)
+    changes = timed(timings, 'get_changed_files', detect_changes.get_changed_files, 'HEAD~1', 'HEAD')
+
+    resources_map, deleted_map, to_expand = timed(timings, 'classification', detect_changes.group_changes,
+                                                    changes, definitions)
+
+    def expand():
+        for r_type in to_expand:
+            paths = detect_changes.expand_resource_paths(r_type, definitions['resources'][r_type])
+            resources_map.setdefault(r_type, set()).update(paths)
+
+    timed(timings, 'expansion', expand)
+    sorted_types = timed(timings, 'resolve_dependencies', detect_changes.resolve_dependencies,
+                         set(resources_map), definitions)
+
+    output_map = {}
+    for r_type in sorted_types:
+        config = dict(definitions['resources'][r_type])
+        config['id'] = r_type
+        output_map[r_type] = {'paths': sorted(resources_map[r_type]), 'config': config}
+
+    waves = timed(timings, 'compute_waves', detect_changes.compute_waves, output_map, definitions)
+    timed(timings, 'generate_summary', detect_changes.generate_summary, output_map, deleted_map, definitions)
+
+    return {
+        'changed_files': len(changes),
+        'affected_types': len(output_map),
+        'affected_units': sum(len(d['paths']) for d in output_map.values()),
+        'deleted_units': sum(len(p) for p in deleted_map.values()),
+        'waves': len(waves),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark detect_changes.py on a synthetic repository')
+    parser.add_argument('--units', type=int, default=10000, help='Number of Terragrunt units to generate')
+    parser.add_argument('--types', type=int, default=40, help='Number of resource types')
+    parser.add_argument('--changed', type=int, default=5000, help='Number of units touched by the head commit')
+    parser.add_argument('--templates', type=int, default=2, help='Number of templates changed (forces expansion)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repetitions (best time is reported)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated tree')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated repository')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    repo = tempfile.mkdtemp(prefix='detect-changes-bench-')
+    cwd = os.getcwd()
+    env_summary = os.environ.pop('GITHUB_STEP_SUMMARY', None)
+    env_output = os.environ.pop('GITHUB_OUTPUT', None)
+    try:
+        print(f"Generating {args.units} units / {args.types} types in {repo}...", file=sys.stderr)
+        start = time.perf_counter()
+        generated = generate_repo(repo, args.units, args.types, args.changed, args.templates, rng)
+        generation_time = round(time.perf_counter() - start, 3)
+
+        os.chdir(repo)
+        runs: List[Dict[str, float]] = []
+        counts = {}
+        for _ in range(max(1, args.repeat)):
+            timings: Dict[str, float] = {}
+            # Keep the expansion and summary chatter out of the benchmark output
+            with contextlib.redirect_stderr(io.StringIO()):
+                counts = run_detection(os.path.join(repo, 'resource-definitions.yml'), timings)
+            timings['total'] = round(sum(timings.values()), 6)
+            runs.append(timings)
+    finally:
+        os.chdir(cwd)
+        if env_summary is not None:
+            os.environ['GITHUB_STEP_SUMMARY'] = env_summary
+        if env_output is not None:
+            os.environ['GITHUB_OUTPUT'] = env_output
+        if not args.keep:
+            shutil.rmtree(repo, ignore_errors=True)
+
+    best = {stage: min(run[stage] for run in runs) for stage in runs[0]}
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'generated': generated,
+        'generation_seconds': generation_time,
+        'counts': counts,
+        'timings_best': best,
+        'timings_runs': runs,
+    }
+    if args.keep:
+        report['repository'] = repo
+
+    for stage, seconds in best.items():
+        print(f"  {stage:<22} {seconds * 1000:>10.1f} ms", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Report saved to: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,36 @@ import yaml
 import subprocess
 import re
 import argparse
-from typing import Dict, List, Set, Any
+import hashlib
+import heapq
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Any
 
-def load_resource_definitions(path: str) -> Dict[str, Any]:
+# libyaml's C loader is several times faster; fall back to the pure-Python one
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def load_resource_definitions(path: str, cache: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Parse resource-definitions.yml.
+
+    With a classification cache (already keyed by the definitions hash)
+    the parsed structure is stored in it and reused instead of re-parsing.
+    """
+    if cache is not None and isinstance(cache.get('definitions'), dict):
+        return cache['definitions']
     with open(path, 'r') as f:
-        return yaml.safe_load(f)
+        definitions = yaml.load(f, Loader=YAML_LOADER)
+    if cache is not None:
+        cache['definitions'] = definitions
+    return definitions
 
-def get_changed_files(base_ref: str, head_ref: str) -> List[str]:
-    """Get list of changed files between two refs."""
+def get_changed_files(base_ref: str, head_ref: str) -> List[Tuple[str, str]]:
+    """
+    Get (status, path) pairs for files changed between two refs.
+
+    Status is one of A (added), M (modified) or D (deleted). Renames and
+    copies are reported by git directly (-M), so a moved file becomes a
+    delete of the old path plus an add of the new one.
+    """
     # Validate base_ref is an ancestor of head_ref (handles force push where old commit is orphaned)
     try:
         subprocess.check_output(
@@ -24,14 +46,65 @@ def get_changed_files(base_ref: str, head_ref: str) -> List[str]:
         print(f"Warning: base-ref '{base_ref}' is not an ancestor of HEAD (possibly force push), using HEAD~1", file=sys.stderr)
         base_ref = 'HEAD~1'
 
-    cmd = ['git', 'diff', '--name-only', base_ref, head_ref]
+    cmd = ['git', 'diff', '--name-status', '-M', '-z', base_ref, head_ref]
     try:
-        output = subprocess.check_output(cmd, text=True)
-        return [line.strip() for line in output.splitlines() if line.strip()]
-    except subprocess.CalledProcessError as e:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    except OSError as e:
         print(f"Error getting changed files: {e}", file=sys.stderr)
         return []
 
+    changes = list(parse_name_status(read_nul_fields(proc.stdout)))
+    proc.stdout.close()
+    if proc.wait() != 0:
+        print(f"Error getting changed files: {' '.join(cmd)} exited with {proc.returncode}", file=sys.stderr)
+        return []
+    return changes
+
+def read_nul_fields(stream, chunk_size: int = 65536) -> Iterator[str]:
+    """Yield NUL-terminated fields from a binary stream without buffering it all."""
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        *fields, pending = pending.split(b'\0')
+        for field in fields:
+            yield field.decode('utf-8', 'surrogateescape')
+    if pending:
+        yield pending.decode('utf-8', 'surrogateescape')
+
+def parse_name_status(fields: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Parse `git diff --name-status -z` fields into (status, path) pairs.
+
+    Renames (R) expand to a delete of the old path and an add of the new
+    path; copies (C) only add the new path. Type changes and unmerged
+    entries are treated as modifications.
+    """
+    fields = iter(fields)
+    for status in fields:
+        if not status:
+            continue
+        kind = status[0]
+        if kind in ('R', 'C'):
+            old_path = next(fields, None)
+            new_path = next(fields, None)
+            if old_path is None or new_path is None:
+                break
+            if kind == 'R':
+                yield 'D', old_path
+            yield 'A', new_path
+            continue
+
+        path = next(fields, None)
+        if path is None:
+            break
+        if kind in ('A', 'D'):
+            yield kind, path
+        else:
+            yield 'M', path
+
 def match_pattern(file_path: str, patterns: Any) -> bool:
     """Check if file matches any of the patterns."""
     if not patterns:
@@ -66,42 +139,257 @@ def get_affected_resources(changed_files: List[str], definitions: Dict[str, Any]
 
     return affected
 
+def build_dependency_graph(definitions: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Build the full type -> dependencies graph from the definitions.
+    Dependencies that are referenced but not defined become leaf nodes.
+    """
+    graph = {}
+    for name, config in definitions.get('resources', {}).items():
+        deps = (config or {}).get('dependencies') or []
+        graph[name] = list(deps)
+    for deps in list(graph.values()):
+        for dep in deps:
+            graph.setdefault(dep, [])
+    return graph
+
+def find_dependency_cycles(graph: Dict[str, List[str]]) -> List[List[str]]:
+    """
+    Find every dependency cycle using an iterative Tarjan SCC search.
+
+    Returns one entry per strongly connected component that contains a cycle
+    (more than one member, or a self-dependency). Each entry is a closed
+    member path such as ['a', 'b', 'c', 'a'], following dependency edges.
+    """
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    counter = 0
+
+    for root in graph:
+        if root in index:
+            continue
+        # Each work item is (node, iterator over its dependencies)
+        work = [(root, iter(graph[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            node, deps = work[-1]
+            advanced = False
+            for dep in deps:
+                if dep not in index:
+                    index[dep] = lowlink[dep] = counter
+                    counter += 1
+                    stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(graph[dep])))
+                    advanced = True
+                    break
+                if dep in on_stack:
+                    lowlink[node] = min(lowlink[node], index[dep])
+            if advanced:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or node in graph[node]:
+                    components.append(_cycle_path(component, graph))
+
+    return components
+
+def _cycle_path(component: List[str], graph: Dict[str, List[str]]) -> List[str]:
+    """Return the shortest closed path through a strongly connected component."""
+    members = set(component)
+    start = min(component)
+    if start in graph[start]:
+        return [start, start]
+
+    # Breadth-first search from start back to itself inside the component
+    parents = {start: None}
+    queue = [start]
+    for node in queue:
+        for dep in graph[node]:
+            if dep == start:
+                path = [node]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                path.reverse()
+                return path + [start]
+            if dep in members and dep not in parents:
+                parents[dep] = node
+                queue.append(dep)
+    return sorted(component) + [start]
+
+def topological_order(graph: Dict[str, List[str]]) -> List[str]:
+    """
+    Order every node so that dependencies come first (Kahn's algorithm).
+    Ties keep definition order; nodes caught in or behind cycles come last.
+    """
+    position = {name: i for i, name in enumerate(graph)}
+    pending = {name: len(set(deps)) for name, deps in graph.items()}
+    dependents = {name: [] for name in graph}
+    for name, deps in graph.items():
+        for dep in set(deps):
+            dependents[dep].append(name)
+
+    ready = [(position[name], name) for name, count in pending.items() if count == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, node = heapq.heappop(ready)
+        order.append(node)
+        for dependent in dependents[node]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                heapq.heappush(ready, (position[dependent], dependent))
+
+    if len(order) < len(graph):
+        # Cycle members and everything downstream of them: depth-first
+        # post-order keeps dependencies first wherever no cycle is involved
+        placed = set(order)
+        for root in graph:
+            if root in placed:
+                continue
+            placed.add(root)
+            work = [(root, iter(graph[root]))]
+            while work:
+                node, deps = work[-1]
+                for dep in deps:
+                    if dep not in placed:
+                        placed.add(dep)
+                        work.append((dep, iter(graph[dep])))
+                        break
+                else:
+                    work.pop()
+                    order.append(node)
+    return order
+
 def resolve_dependencies(affected: Set[str], definitions: Dict[str, Any]) -> List[str]:
     """
     Sort affected resources based on dependencies.
     Returns a list of resource names in execution order.
+
+    The sort runs over the full definitions graph, so ordering is preserved
+    through dependency chains that pass through unaffected types.
     """
-    resources = definitions.get('resources', {})
+    graph = build_dependency_graph(definitions)
 
-    # Topological sort
-    result = []
-    visited = set()
-    temp_visited = set()
+    for cycle in find_dependency_cycles(graph):
+        print(f"Warning: Circular dependency detected: {' -> '.join(cycle)}", file=sys.stderr)
 
-    def visit(node):
-        if node in temp_visited:
-            print(f"Warning: Circular dependency detected involving {node}", file=sys.stderr)
-            return
-        if node in visited:
-            return
-        if node not in affected:
-            return
+    ordered = [name for name in topological_order(graph) if name in affected]
+    # Types that are affected but missing from the definitions keep a stable position
+    ordered.extend(sorted(affected - set(ordered)))
+    return ordered
 
-        temp_visited.add(node)
+def load_durations(source: str) -> Dict[str, float]:
+    """
+    Load historical plan durations (seconds) keyed by unit path, from an
+    inline JSON object or from the path of a JSON file.
+    """
+    if not source or not source.strip():
+        return {}
+    inline = source.strip().startswith('{')
+    label = "inline JSON" if inline else source
+    try:
+        if inline:
+            data = json.loads(source)
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        return {str(k): float(v) for k, v in data.items()}
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"Warning: Could not read durations from {label}: {e}", file=sys.stderr)
+        return {}
+
+def compute_waves(output_map: Dict[str, Any], definitions: Dict[str, Any],
+                  durations: Dict[str, float] = None, max_batches: int = 0) -> List[Dict[str, Any]]:
+    """
+    Group changed units into execution waves.
 
-        # Visit dependencies first
-        deps = resources.get(node, {}).get('dependencies', [])
-        for dep in deps:
-            visit(dep)
+    A resource type's wave is the number of changed types on its longest
+    dependency chain, following dependencies through unchanged types too.
+    Every unit in a wave can run concurrently with every other unit in it.
 
-        temp_visited.remove(node)
-        visited.add(node)
-        result.append(node)
+    Each wave is a matrix-friendly list of {resource_type, paths, weight}
+    entries. Without max_batches every unit gets its own entry. With
+    max_batches, units are packed longest-first into the least loaded batch
+    of the same type, so batches end up with similar total duration; a wave
+    containing more types than max_batches still gets one batch per type.
+    """
+    durations = durations or {}
+    affected = set(output_map.keys())
+
+    # rank(t) = number of affected types strictly above t on its longest chain.
+    # Nodes are visited in topological order so every dependency is ranked first;
+    # edges into cycles fall back to whatever rank has been recorded so far.
+    graph = build_dependency_graph(definitions)
+    ranks = {}
+    for node in topological_order(graph):
+        ranks[node] = max(
+            (ranks.get(dep, 0) + (1 if dep in affected else 0) for dep in graph[node]),
+            default=0
+        )
 
-    for resource in affected:
-        visit(resource)
+    # Unknown units are weighted with the mean of known durations
+    known = [durations[p] for data in output_map.values() for p in data['paths'] if p in durations]
+    default_weight = sum(known) / len(known) if known else 1.0
+
+    by_wave = {}
+    for r_type in output_map:
+        by_wave.setdefault(ranks.get(r_type, 0), []).append(r_type)
+
+    waves = []
+    for index, wave in enumerate(sorted(by_wave)):
+        units = [
+            (durations.get(path, default_weight), r_type, path)
+            for r_type in by_wave[wave]
+            for path in output_map[r_type]['paths']
+        ]
+        # Longest first, ties broken by type/path for stable output
+        units.sort(key=lambda u: (-u[0], u[1], u[2]))
+
+        batches = []
+        batches_by_type = {}
+        for weight, r_type, path in units:
+            same_type = batches_by_type.setdefault(r_type, [])
+            if not max_batches or len(batches) < max_batches or not same_type:
+                batch = {"resource_type": r_type, "paths": [path], "weight": weight}
+                batches.append(batch)
+                same_type.append(batch)
+            else:
+                target = min(same_type, key=lambda b: b['weight'])
+                target['paths'].append(path)
+                target['weight'] += weight
 
-    return result
+        for batch in batches:
+            batch['paths'].sort()
+            batch['weight'] = round(batch['weight'], 2)
+        batches.sort(key=lambda b: (b['resource_type'], b['paths']))
+
+        waves.append({
+            "wave": index,
+            "weight": max(b['weight'] for b in batches),
+            "include": batches
+        })
+
+    return waves
 
 def expand_resource_paths(resource_name: str, config: Dict[str, Any]) -> Set[str]:
     """
@@ -152,36 +440,177 @@ def expand_resource_paths(resource_name: str, config: Dict[str, Any]) -> Set[str
 
     return found_paths
 
-def find_resource_root(file_path: str) -> str:
-    """Find the directory containing terragrunt.hcl for a given file."""
+def find_resource_root(file_path: str, floor: str = None) -> str:
+    """
+    Find the directory containing terragrunt.hcl for a given file, never
+    walking above `floor` when one is given.
+    """
     current = os.path.dirname(os.path.abspath(file_path))
+    floor = os.path.abspath(floor) if floor else None
     # Stop at git root or some reasonable limit
     while len(current) > 1:
+        if floor and current != floor and not current.startswith(floor + os.sep):
+            return None
         if os.path.exists(os.path.join(current, 'terragrunt.hcl')):
             return current
         current = os.path.dirname(current)
     return None
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--definitions', required=True, help='Path to resource-definitions.yml')
-    parser.add_argument('--base-ref', required=True, help='Base git ref')
-    parser.add_argument('--head-ref', required=True, help='Head git ref')
-    args = parser.parse_args()
+def pattern_floor(file_path: str, config: Dict[str, Any]) -> str:
+    """
+    The directory a `dir/**` path_pattern matched for file_path (the
+    deepest one when `**` allows several), or None for file patterns.
+    A unit's root is never above it.
+    """
+    patterns = config.get('path_pattern') or []
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    prefixes = [pattern[:-3] for pattern in patterns if pattern.endswith('/**')]
+    directory = os.path.dirname(file_path)
+    while directory:
+        if any(match_pattern(directory, prefix) for prefix in prefixes):
+            return directory
+        directory = os.path.dirname(directory)
+    return None
 
-    definitions = load_resource_definitions(args.definitions)
-    changed_files = get_changed_files(args.base_ref, args.head_ref)
+CACHE_VERSION = 1
 
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
+def get_tree_id(ref: str, path: str = 'live') -> str:
+    """Return the git tree id of a directory at a ref, or '' if unavailable."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', f"{ref}:{path}"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return ''
 
-    # Group changed files by resource type
+def get_worktree_tree_id(path: str = 'live') -> str:
+    """
+    Return the git tree id of a directory as it is on disk: its tree at HEAD
+    when it has no modified or untracked files, '' otherwise or if unavailable.
+    """
+    try:
+        status = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=all', '--', path],
+            text=True, stderr=subprocess.DEVNULL
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return ''
+    return get_tree_id('HEAD', path) if not status.strip() else ''
+
+def load_classification_cache(path: str, definitions_hash: str) -> Dict[str, Any]:
+    """
+    Load the path -> resource type cache written by a previous run.
+
+    The cache is only reused when it was built from identical resource
+    definitions; otherwise an empty cache for the current hash is returned.
+    """
+    empty = {
+        "version": CACHE_VERSION,
+        "definitions_hash": definitions_hash,
+        "classifications": {},
+        "expansions": {}
+    }
+    if not path or not os.path.exists(path):
+        return empty
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable classification cache {path}: {e}", file=sys.stderr)
+        return empty
+
+    if (not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION
+            or cache.get('definitions_hash') != definitions_hash):
+        print("Resource definitions changed, discarding classification cache", file=sys.stderr)
+        return empty
+    cache.setdefault('classifications', {})
+    cache.setdefault('expansions', {})
+    return cache
+
+def save_classification_cache(path: str, cache: Dict[str, Any]):
+    """Atomically write the classification cache."""
+    if not path:
+        return
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write classification cache {path}: {e}", file=sys.stderr)
+
+def prune_classification_cache(cache: Dict[str, Any]):
+    """Drop classifications of paths that no longer exist on disk."""
+    classifications = cache['classifications']
+    for file_path in [p for p in classifications if not os.path.lexists(p)]:
+        del classifications[file_path]
+
+def classify_path(file_path: str, definitions: Dict[str, Any], cache: Dict[str, Any] = None) -> Any:
+    """Return the first resource type whose patterns match file_path, or None."""
+    classifications = cache['classifications'] if cache is not None else {}
+    if file_path in classifications:
+        return classifications[file_path]
+
+    matched_type = None
+    for name, config in definitions.get('resources', {}).items():
+        if match_pattern(file_path, config.get('exclude_pattern')):
+            continue
+        if match_pattern(file_path, config.get('path_pattern')):
+            matched_type = name
+            break
+
+    if cache is not None:
+        classifications[file_path] = matched_type
+    return matched_type
+
+def expand_resource_paths_cached(resource_name: str, config: Dict[str, Any],
+                                 cache: Dict[str, Any] = None, tree_id: str = '') -> Set[str]:
+    """
+    expand_resource_paths with results reused while the live/ tree is unchanged.
+    The tree id is the git object id of live/ on disk (get_worktree_tree_id);
+    without one, e.g. in a dirty checkout, the cache is bypassed.
+    """
+    if cache is None or not tree_id:
+        return expand_resource_paths(resource_name, config)
+
+    cached = cache['expansions'].get(resource_name)
+    if cached and cached.get('tree') == tree_id:
+        print(f"Expanding {resource_name} (cached)", file=sys.stderr)
+        return set(cached['paths'])
+
+    found_paths = expand_resource_paths(resource_name, config)
+    cache['expansions'][resource_name] = {"tree": tree_id, "paths": sorted(found_paths)}
+    return found_paths
+
+def group_changes(changed_files: List[Tuple[str, str]], definitions: Dict[str, Any],
+                  cache: Dict[str, Any] = None) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]], Set[str]]:
+    """
+    Group (status, path) changes into unit roots per resource type.
+    Returns (changed units by type, deleted units by type, types whose template changed).
+    """
     resources_map = {} # Type -> Set[Paths]
     deleted_resources_map = {} # Type -> Set[Paths]
 
     # Track which resources need full expansion due to template changes
     resources_to_expand = set()
 
-    for file_path in changed_files:
+    # Units removed in this diff, including the old side of a moved unit
+    deleted_roots = {os.path.dirname(file_path) for status, file_path in changed_files
+                     if status == 'D' and os.path.basename(file_path) == 'terragrunt.hcl'}
+
+    for status, file_path in changed_files:
         # Check for template changes
         for name, config in definitions.get('resources', {}).items():
             template_path = config.get('template_path')
@@ -189,18 +618,13 @@ def main():
                 resources_to_expand.add(name)
 
         # Find which resource type this file belongs to (direct changes)
-        matched_type = None
-        for name, config in definitions.get('resources', {}).items():
-            if match_pattern(file_path, config.get('exclude_pattern')):
-                continue
-            if match_pattern(file_path, config.get('path_pattern')):
-                matched_type = name
-                break
+        matched_type = classify_path(file_path, definitions, cache)
 
         if matched_type:
+            floor = pattern_floor(file_path, definitions['resources'][matched_type])
             # Find the specific instance directory (where terragrunt.hcl lives)
-            if os.path.exists(file_path):
-                root = find_resource_root(file_path)
+            if status != 'D':
+                root = find_resource_root(file_path, floor)
                 if root:
                     # Check if it's an example resource
                     if os.path.basename(root).startswith('example-'):
@@ -228,8 +652,15 @@ def main():
                         deleted_resources_map[matched_type] = set()
                     deleted_resources_map[matched_type].add(rel_root)
                 else:
+                    # A file of a unit deleted (or moved away) in this diff goes with it; otherwise
+                    # walking up would land on an enclosing unit such as the project
+                    parent = os.path.dirname(file_path)
+                    while parent and parent not in deleted_roots:
+                        parent = os.path.dirname(parent)
+                    if parent:
+                        continue
                     # Non-terragrunt.hcl file deleted - find resource root if it exists
-                    root = find_resource_root(file_path)
+                    root = find_resource_root(file_path, floor)
                     if root:
                         # Resource still exists, just a file within it was deleted
                         rel_root = os.path.relpath(root, os.getcwd())
@@ -237,9 +668,36 @@ def main():
                             resources_map[matched_type] = set()
                         resources_map[matched_type].add(rel_root)
 
+    return resources_map, deleted_resources_map, resources_to_expand
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--definitions', required=True, help='Path to resource-definitions.yml')
+    parser.add_argument('--base-ref', required=True, help='Base git ref')
+    parser.add_argument('--head-ref', required=True, help='Head git ref')
+    parser.add_argument('--durations', help='Optional JSON map of unit path to historical plan duration (seconds), inline or as a file path')
+    parser.add_argument('--max-batches', type=int, default=0,
+                        help='Pack each wave into at most this many duration-balanced batches (0 = one entry per unit)')
+    parser.add_argument('--cache', help='Optional path of a JSON cache of path classifications, keyed by the definitions hash')
+    args = parser.parse_args()
+
+    # Classification cache, only valid for identical resource definitions
+    cache = None
+    tree_id = ''
+    if args.cache:
+        cache = load_classification_cache(args.cache, file_sha256(args.definitions))
+        # Expansion walks the checkout, so key it on what is on disk rather than the head ref
+        tree_id = get_worktree_tree_id()
+
+    definitions = load_resource_definitions(args.definitions, cache)
+    changed_files = get_changed_files(args.base_ref, args.head_ref)
+
+    # Group changed files by resource type
+    resources_map, deleted_resources_map, resources_to_expand = group_changes(changed_files, definitions, cache)
+
     # Expand resources that had template changes
     for r_type in resources_to_expand:
-        expanded_paths = expand_resource_paths(r_type, definitions['resources'][r_type])
+        expanded_paths = expand_resource_paths_cached(r_type, definitions['resources'][r_type], cache, tree_id)
         if r_type not in resources_map:
             resources_map[r_type] = set()
         resources_map[r_type].update(expanded_paths)
@@ -248,6 +706,10 @@ def main():
     affected_types = set(resources_map.keys())
     sorted_types = resolve_dependencies(affected_types, definitions)
 
+    if cache is not None:
+        prune_classification_cache(cache)
+        save_classification_cache(args.cache, cache)
+
     # Construct Output Map
     output_map = {}
     for r_type in sorted_types:
@@ -267,6 +729,10 @@ def main():
     # Output changes and emojis to GITHUB_OUTPUT
     write_github_output("changes", json.dumps(output_map))
 
+    # Execution waves for matrix-driven parallel runs
+    waves = compute_waves(output_map, definitions, load_durations(args.durations), args.max_batches)
+    write_github_output("waves", json.dumps(waves))
+
     # Generate emojis map for all resources
     emojis_map = {}
     for name, config in definitions.get('resources', {}).items():
@@ -0,0 +1,49 @@
+"""Tests for detect_changes.py (run with `python -m pytest .github/scripts/tests`)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import detect_changes  # noqa: E402
+
+DEFINITIONS = {
+    "resources": {
+        "project": {"path_pattern": "live/**/project/**"},
+        "vpc-network": {"path_pattern": ["live/**/vpc-network/**", "live/**/*-vpc-network/**"]},
+    }
+}
+
+
+def write(root, path, text=""):
+    full = root / path
+    full.parent.mkdir(parents=True, exist_ok=True)
+    full.write_text(text)
+
+
+def test_moved_unit_is_planned_at_its_new_path_only(tmp_path, monkeypatch):
+    # After `git mv live/dev/proj/vpc-network live/dev/proj2/vpc-network`, with a project unit above the old path
+    write(tmp_path, "live/dev/proj/terragrunt.hcl")
+    write(tmp_path, "live/dev/proj2/vpc-network/terragrunt.hcl")
+    write(tmp_path, "live/dev/proj2/vpc-network/subnets.yaml")
+    monkeypatch.chdir(tmp_path)
+
+    fields = ["R100", "live/dev/proj/vpc-network/terragrunt.hcl", "live/dev/proj2/vpc-network/terragrunt.hcl",
+              "R100", "live/dev/proj/vpc-network/subnets.yaml", "live/dev/proj2/vpc-network/subnets.yaml"]
+    changes = list(detect_changes.parse_name_status(fields))
+    resources, deleted, _ = detect_changes.group_changes(changes, DEFINITIONS)
+
+    assert resources == {"vpc-network": {"live/dev/proj2/vpc-network"}}
+    assert deleted == {"vpc-network": {"live/dev/proj/vpc-network"}}
+
+
+def test_deleted_file_never_resolves_above_the_matched_directory(tmp_path, monkeypatch):
+    # The unit's terragrunt.hcl is not part of the diff, and the unit directory is gone
+    write(tmp_path, "live/dev/proj/terragrunt.hcl")
+    monkeypatch.chdir(tmp_path)
+
+    resources, deleted, _ = detect_changes.group_changes(
+        [("D", "live/dev/proj/vpc-network/subnets.yaml")], DEFINITIONS)
+
+    assert resources == {}
+    assert deleted == {}
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Load-time benchmark for ip-allocation-checker.py
+
+Generates a large ip-allocation.yaml (many environments, each with primary
+subnets and GKE secondary ranges carrying range/size/description like the
+real file) and times loading it with the pure-Python SafeLoader, the libyaml
+CSafeLoader, and from the parsed-structure cache, plus a full validate.
+
+Usage:
+    python3 scripts/benchmark-ip-allocation-checker.py
+    python3 scripts/benchmark-ip-allocation-checker.py --envs 1000 --subnets 40 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import ipaddress
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict
+
+from script_loader import load_script
+
+
+def load_checker_module():
+    return load_script("ip-allocation-checker.py")
+
+def generate_allocations(envs: int, subnets: int) -> Dict[str, Any]:
+    """
+    One /17 per environment counting up from 10.0.0.0 (continuing past
+    10.255 for very large runs), `subnets` /24 primaries in its lower half
+    and a pods/services pair per 8 subnets in its upper half.
+    """
+    def address(value: int) -> str:
+        return str(ipaddress.IPv4Address(value))
+
+    def entry(start: int, prefixlen: int, **extra) -> Dict[str, Any]:
+        size = 1 << (32 - prefixlen)
+        return {'cidr': f"{address(start)}/{prefixlen}", 'range': f"{address(start)} - {address(start + size - 1)}",
+                'size': size, **extra}
+
+    base = int(ipaddress.IPv4Address("10.0.0.0"))
+    environments = {}
+    for e in range(envs):
+        block = base + e * (1 << 15)
+        primary = {f"subnet-{k:03d}": entry(block + (k % 64) * 256, 24,
+                                            description=f"Generated subnet {k} of environment {e}")
+                   for k in range(subnets)}
+        clusters = range(max(1, subnets // 8))
+        pods = {f"cluster-{c + 1:02d}": entry(block + (64 + (c * 2) % 64) * 256, 24, status='allocated')
+                for c in clusters}
+        services = {f"cluster-{c + 1:02d}": entry(block + (65 + (c * 2) % 64) * 256, 25, status='allocated')
+                    for c in clusters}
+        environments[f"env-{e:04d}"] = {
+            'block': f"{address(block)}/17",
+            'range': entry(block, 17)['range'],
+            'total_ips': 1 << 15,
+            'status': 'active',
+            'primary_subnets': primary,
+            'gke_secondary_ranges': {'pods': pods, 'services': services},
+        }
+    return {
+        'metadata': {'schema_version': "1.2", 'description': "Generated for benchmarking"},
+        'development': {'block': "10.0.0.0/8", 'total_ips': 1 << 24, 'environments': environments},
+    }
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ip-allocation-checker.py load time on a generated file')
+    parser.add_argument('--envs', type=int, default=500, help='Number of environments to generate')
+    parser.add_argument('--subnets', type=int, default=40, help='Primary subnets per environment')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repetitions (best time is reported)')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    module = load_checker_module()
+    yaml = module.yaml
+    workdir = tempfile.mkdtemp(prefix='ip-allocation-bench-')
+    try:
+        allocation_path = os.path.join(workdir, 'ip-allocation.yaml')
+        cache_path = os.path.join(workdir, 'ip-allocation.cache')
+        with open(allocation_path, 'w', encoding='utf-8') as f:
+            yaml.dump(generate_allocations(args.envs, args.subnets), f,
+                      Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper), sort_keys=False)
+        with open(allocation_path, 'rb') as f:
+            raw = f.read()
+
+        def checker(cache_file=None):
+            return module.IPAllocationChecker(allocation_path, cache_file=cache_file)
+
+        timings = {'pure_safe_loader': best_time(lambda: yaml.load(raw, Loader=yaml.SafeLoader), args.repeat)}
+        if hasattr(yaml, 'CSafeLoader'):
+            timings['c_safe_loader'] = best_time(lambda: yaml.load(raw, Loader=yaml.CSafeLoader), args.repeat)
+        checker(cache_path)  # populate the cache
+        timings['checker_uncached'] = best_time(checker, args.repeat)
+        timings['checker_cached'] = best_time(lambda: checker(cache_path), args.repeat)
+        loaded = checker(cache_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings['validate'] = best_time(loaded.validate, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "libyaml": hasattr(yaml, 'CSafeLoader'),
+        "parameters": {"envs": args.envs, "subnets": args.subnets, "repeat": args.repeat},
+        "file_bytes": len(raw),
+        "ranges": len(loaded.ranges),
+        "seconds": {name: round(seconds, 6) for name, seconds in timings.items()},
+    }
+
+    for name, seconds in timings.items():
+        print(f"  {name:<20} {seconds * 1000:>10.1f} ms", file=sys.stderr)
+    pure = timings['pure_safe_loader']
+    for name in ('c_safe_loader', 'checker_cached'):
+        if name in timings and timings[name]:
+            print(f"  {name} is {pure / timings[name]:.1f}x faster than the pure-Python loader", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Report saved to: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
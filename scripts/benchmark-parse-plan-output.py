@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for parse-plan-output.py
+
+Replays the recorded plan fixtures in scripts/fixtures/plans/ (text logs
+and `tofu show -json` plans), scaled up to a target size, through the
+parser and reports throughput for each fixture (full parse and the
+--only destructive risk scan) and for the hot per-line helpers: lines per
+second for text logs, resource changes per second for JSON plans, and MB/s
+for both. Compare against a saved baseline to catch regressions.
+
+Usage:
+    python3 scripts/benchmark-parse-plan-output.py
+    python3 scripts/benchmark-parse-plan-output.py --output bench.json
+    python3 scripts/benchmark-parse-plan-output.py --baseline bench.json --max-regression 0.2
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from script_loader import load_script
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(SCRIPT_DIR, "fixtures", "plans")
+
+
+def load_parser_module():
+    return load_script("parse-plan-output.py")
+
+def scale_fixture(path: str, target_lines: int, target_changes: int) -> bytes:
+    """Repeat a text fixture to roughly target_lines lines, or a JSON plan's changes to roughly target_changes"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    if path.endswith('.json'):
+        plan = json.loads(raw)
+        changes = plan.get("resource_changes", [])
+        plan["resource_changes"] = changes * max(1, target_changes // max(1, len(changes)))
+        return json.dumps(plan).encode('utf-8')
+
+    copies = max(1, target_lines // max(1, raw.count(b'\n')))
+    return raw * copies
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench_fixture(module, path: str, target_lines: int, target_changes: int, repeat: int) -> Dict[str, Any]:
+    data = scale_fixture(path, target_lines, target_changes)
+    # A JSON plan is a single line, so it is measured in resource changes
+    unit = "changes" if path.endswith('.json') else "lines"
+    count = len(json.loads(data)["resource_changes"]) if unit == "changes" else data.count(b'\n')
+    resources = []
+
+    def run():
+        resources.clear()
+        parser, records = module.open_plan_parser(io.BufferedReader(io.BytesIO(data)))
+        resources.extend(records)
+
+    def run_filtered():
+        module.scan_plan_risks(io.BufferedReader(io.BytesIO(data)), only="destructive", types=["sensitive"])
+
+    seconds = best_time(run, repeat)
+    filtered_seconds = best_time(run_filtered, repeat)
+    return {
+        "fixture": os.path.basename(path),
+        "bytes": len(data),
+        "unit": unit,
+        unit: count,
+        "resources": len(resources),
+        "seconds": round(seconds, 6),
+        f"{unit}_per_sec": round(count / seconds) if seconds else None,
+        "mb_per_sec": round(len(data) / seconds / 1e6, 2) if seconds else None,
+        "filtered_seconds": round(filtered_seconds, 6),
+        f"filtered_{unit}_per_sec": round(count / filtered_seconds) if filtered_seconds else None,
+    }
+
+def bench_helpers(module, repeat: int) -> List[Dict[str, Any]]:
+    """Micro-benchmarks for the per-line helpers on lines taken from the text fixtures"""
+    sample = []
+    for name in sorted(os.listdir(FIXTURE_DIR)):
+        if not name.endswith('.json'):
+            with open(os.path.join(FIXTURE_DIR, name), 'r', encoding='utf-8') as f:
+                sample.extend(f.read().splitlines())
+    sample = sample * max(1, 100000 // max(1, len(sample)))
+    cleaned = [module.clean_line(line) for line in sample]
+
+    def headers():
+        for line in cleaned:
+            if line[:1] in module.HEADER_FIRST_CHARS and line.endswith("{"):
+                module.parse_resource_header(line)
+
+    def attribute_trees():
+        tree = None
+        for line in cleaned:
+            if tree is None:
+                if line[:1] in module.HEADER_FIRST_CHARS and line.endswith("{"):
+                    resource = module.parse_resource_header(line)
+                    if resource:
+                        tree = module.AttributeTreeParser(resource["action"])
+            elif tree.feed(line):
+                tree.result()
+                tree = None
+
+    results = []
+    for name, func in (
+        ("clean_line", lambda: [module.clean_line(line) for line in sample]),
+        ("header_dispatch", headers),
+        ("attribute_tree", attribute_trees),
+    ):
+        seconds = best_time(func, repeat)
+        results.append({
+            "helper": name,
+            "lines": len(sample),
+            "seconds": round(seconds, 6),
+            "lines_per_sec": round(len(sample) / seconds) if seconds else None,
+        })
+    return results
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Return one message per benchmark slower than baseline by more than max_regression"""
+    failures = []
+    for section, key in (("fixtures", "fixture"), ("helpers", "helper")):
+        previous = {entry[key]: entry for entry in baseline.get(section, [])}
+        for entry in report[section]:
+            old = previous.get(entry[key])
+            unit = entry.get("unit", "lines")
+            rate = f"{unit}_per_sec"
+            if not old or not old.get(rate) or not entry.get(rate):
+                continue
+            ratio = entry[rate] / old[rate]
+            if ratio < 1 - max_regression:
+                failures.append(f"{entry[key]}: {entry[rate]:,} {unit}/s "
+                                f"vs baseline {old[rate]:,} ({(1 - ratio) * 100:.0f}% slower)")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parse-plan-output.py throughput on recorded fixtures')
+    parser.add_argument('--target-lines', type=int, default=200000,
+                        help='Scale each text fixture to about this many lines')
+    parser.add_argument('--target-changes', type=int, default=20000,
+                        help='Scale each JSON plan fixture to about this many resource changes')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repetitions (best time is reported)')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare against a previous JSON report')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Fail if throughput drops by more than this fraction vs baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    module = load_parser_module()
+    fixtures = sorted(os.path.join(FIXTURE_DIR, name) for name in os.listdir(FIXTURE_DIR))
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ijson": module.ijson is not None,
+        "parameters": {"target_lines": args.target_lines, "target_changes": args.target_changes,
+                       "repeat": args.repeat},
+        "fixtures": [bench_fixture(module, path, args.target_lines, args.target_changes, args.repeat)
+                     for path in fixtures],
+        "helpers": bench_helpers(module, args.repeat),
+    }
+
+    for entry in report["fixtures"]:
+        unit = entry['unit']
+        print(f"  {entry['fixture']:<28} {entry[f'{unit}_per_sec']:>12,} {unit}/s  {entry['mb_per_sec']:>7} MB/s"
+              f"  (--only destructive: {entry[f'filtered_{unit}_per_sec']:,} {unit}/s)", file=sys.stderr)
+    for entry in report["helpers"]:
+        print(f"  {entry['helper']:<28} {entry['lines_per_sec']:>12,} lines/s", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Report saved to: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            failures = compare(report, json.load(f), args.max_regression)
+        if failures:
+            print("\n⚠️  Throughput regressions detected:", file=sys.stderr)
+            for failure in failures:
+                print(f"  - {failure}", file=sys.stderr)
+            sys.exit(1)
+        print("\n✅ No throughput regressions against baseline", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
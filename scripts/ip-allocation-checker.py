@@ -6,21 +6,43 @@ This script validates IP allocations, checks for conflicts, and provides
 visualization of the IP space usage.
 
 Usage:
-    python3 ip-allocation-checker.py [command]
+    python3 ip-allocation-checker.py [--cache FILE] [command]
+
+    --cache FILE keeps the parsed ip-allocation.yaml in FILE, keyed by the
+    file's SHA-256, so later runs skip YAML parsing until the file changes.
 
 Commands:
     validate    - Check for IP conflicts and validate allocations
     visualize   - Show IP allocation visualization
     available   - Show available IP blocks
     next        - Suggest next available allocation
+    reconcile   - Compare ip-allocation.yaml with the IPs used under live/
+                  [--repo-root DIR] [--rendered] [--output FILE]
+    allocate    - Reserve the best-fit free range in an environment block
+                  ENV NAME PREFIXLEN [--kind primary|pods|services]
+                  [--description TEXT] [--dry-run]
+    report      - Capacity report: utilization, fragmentation and free
+                  aligned blocks per block and per /16 [--json] [--output FILE]
 """
 
+import argparse
+import bisect
+from datetime import datetime, timezone
+import hashlib
+import heapq
 import ipaddress
+import json
+import marshal
+import re
 import sys
 import os
-from typing import Dict, List, Tuple, Optional
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Optional
 from collections import defaultdict
 
+from script_loader import load_script
+
 try:
     import yaml
 except ImportError:
@@ -29,118 +51,599 @@ except ImportError:
     print("Or: pip install pyyaml")
     sys.exit(1)
 
+# libyaml's C loader is several times faster; fall back to the pure-Python one
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Bump when the cached structure changes; marshal's own format version is part of the key too
+PARSED_CACHE_VERSION = 1
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Address space we allocate from; anything else found in live/ is a reference
+# (Google IAP and health-check ranges, documentation examples, 0.0.0.0/0)
+ALLOCATABLE_SPACE = [ipaddress.ip_network(cidr) for cidr in
+                     ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '100.64.0.0/10', 'fc00::/7')]
+
+# Sections whose declarations any environment may reference (shared services
+# such as PSA peering ranges, the hub VPN and GKE master ranges)
+CROSS_ENV_SECTIONS = ('psa', 'hub', 'special')
+
+
+def load_ip_tracker():
+    return load_script("track-ip-allocations.py")
+
+
+def address_range(network) -> Tuple[int, int, int]:
+    """(version, first, last) integer bounds of a network"""
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+def parse_cidr(cidr: str) -> Tuple[int, int, int]:
+    """
+    Parse "a.b.c.d/p" (or an IPv6 CIDR, or a bare address) into
+    (version, start, prefixlen). Host bits are kept, so a misaligned CIDR
+    parses and is reported by the alignment check instead of raising.
+    """
+    text = str(cidr).strip()
+    address, _, prefix = text.partition('/')
+    ip = ipaddress.ip_address(address)
+    bits = ADDRESS_BITS[ip.version]
+    prefixlen = int(prefix) if prefix else bits
+    if not 0 <= prefixlen <= bits:
+        raise ValueError(f"invalid prefix length in {text}")
+    return ip.version, int(ip), prefixlen
+
+
+def format_cidr(version: int, start: int, prefixlen: int) -> str:
+    return f"{ipaddress.ip_address(start) if version == 4 else ipaddress.IPv6Address(start)}/{prefixlen}"
+
+
+class RangeTable:
+    """
+    Address ranges stored column-wise as integers: version, start and
+    prefix length per row, plus a metadata dict per row. Starts are Python
+    ints because IPv6 needs 128 bits; the small columns are arrays.
+    """
+
+    def __init__(self):
+        self.versions = array('B')
+        self.prefixlens = array('B')
+        self.starts: List[int] = []
+        self.rows: List[Dict[str, Any]] = []
+
+    def add(self, cidr: str, **meta) -> int:
+        """Append a range, raising ValueError for an unparsable CIDR; returns its row index"""
+        version, start, prefixlen = parse_cidr(cidr)
+        self.versions.append(version)
+        self.prefixlens.append(prefixlen)
+        self.starts.append(start)
+        self.rows.append(meta)
+        return len(self.rows) - 1
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def size(self, i: int) -> int:
+        return 1 << (ADDRESS_BITS[self.versions[i]] - self.prefixlens[i])
+
+    def end(self, i: int) -> int:
+        """Last address of row i (aligned to the prefix)"""
+        return (self.starts[i] & -self.size(i)) + self.size(i) - 1
+
+    def cidr(self, i: int) -> str:
+        return format_cidr(self.versions[i], self.starts[i], self.prefixlens[i])
+
+    def overlapping_pairs(self) -> List[Tuple[int, int]]:
+        """
+        All (i, j) row pairs with i < j whose ranges overlap, in O(n log n + k).
+
+        Rows are swept in (version, start) order with a min-heap of the ends
+        of the ranges still open; every range left open when a new one starts
+        overlaps it.
+        """
+        order = sorted(range(len(self.rows)), key=lambda i: (self.versions[i], self.starts[i] & -self.size(i)))
+        pairs = []
+        active: List[Tuple[int, int]] = []
+        current_version = None
+        for i in order:
+            if self.versions[i] != current_version:
+                active, current_version = [], self.versions[i]
+            start = self.starts[i] & -self.size(i)
+            while active and active[0][0] < start:
+                heapq.heappop(active)
+            pairs.extend((j, i) if j < i else (i, j) for _, j in active)
+            heapq.heappush(active, (self.end(i), i))
+        pairs.sort()
+        return pairs
+
+    def misaligned(self) -> List[int]:
+        """Rows whose start is not a multiple of their size (start % size != 0), for any prefix length"""
+        return [i for i, (version, start, prefixlen) in enumerate(zip(self.versions, self.starts, self.prefixlens))
+                if start & ((1 << (ADDRESS_BITS[version] - prefixlen)) - 1)]
+
+
+class FreeSpaceIndex:
+    """
+    Free space of one block as buddy free lists: each gap between allocated
+    ranges is split into maximal aligned power-of-two blocks, kept in a
+    sorted list per prefix length. Finding a free /N looks at no more than
+    one list head per prefix length; allocating splits the chosen block and
+    files the unused buddies with bisect.
+    """
+
+    def __init__(self, version: int, block_start: int, block_prefixlen: int, allocated: List[Tuple[int, int]]):
+        self.version = version
+        self.bits = ADDRESS_BITS[version]
+        self.block_prefixlen = block_prefixlen
+        self.free: Dict[int, List[int]] = {p: [] for p in range(block_prefixlen, self.bits + 1)}
+
+        block_end = block_start + (1 << (self.bits - block_prefixlen)) - 1
+        cursor = block_start
+        for start, end in sorted(allocated):
+            start, end = max(start, block_start), min(end, block_end)
+            if start > end:
+                continue
+            if start > cursor:
+                self._add_gap(cursor, start - 1)
+            cursor = max(cursor, end + 1)
+        if cursor <= block_end:
+            self._add_gap(cursor, block_end)
+
+    def _add_gap(self, start: int, end: int):
+        while start <= end:
+            size = start & -start if start else 1 << (self.bits - self.block_prefixlen)
+            while start + size - 1 > end:
+                size >>= 1
+            bisect.insort(self.free[self.bits - size.bit_length() + 1], start)
+            start += size
+
+    def find(self, prefixlen: int) -> Optional[Tuple[int, int]]:
+        """Best fit for a /prefixlen: the lowest-addressed smallest free block that holds it, as (start, block prefixlen)"""
+        for candidate in range(min(prefixlen, self.bits), self.block_prefixlen - 1, -1):
+            if self.free[candidate]:
+                return self.free[candidate][0], candidate
+        return None
+
+    def allocate(self, prefixlen: int) -> Optional[int]:
+        """Take a /prefixlen out of the free lists and return its start, or None when nothing fits"""
+        if not self.block_prefixlen <= prefixlen <= self.bits:
+            return None
+        fit = self.find(prefixlen)
+        if fit is None:
+            return None
+        start, block_prefixlen = fit
+        self.free[block_prefixlen].pop(0)
+        # Splitting a /M down to a /N leaves the upper buddy at every level in between
+        for level in range(block_prefixlen + 1, prefixlen + 1):
+            bisect.insort(self.free[level], start + (1 << (self.bits - level)))
+        return start
+
+    def free_addresses(self) -> int:
+        return sum(len(starts) << (self.bits - p) for p, starts in self.free.items())
+
+    def largest_free(self) -> Optional[Tuple[int, int]]:
+        """(start, prefixlen) of the largest free aligned block"""
+        for p in range(self.block_prefixlen, self.bits + 1):
+            if self.free[p]:
+                return self.free[p][0], p
+        return None
+
+
+# Smallest prefix length reported in the free aligned block counts
+REPORT_MAX_PREFIXLEN = {4: 29, 6: 64}
+
+# Heatmap shades for /16 utilization: 0%, <25%, <50%, <75%, >=75%
+HEATMAP_SHADES = '·░▒▓█'
+
+# Keys whose value is the address of the mapping holding them
+ADDRESS_FIELDS = ('cidr', 'block', 'ip')
+
+
+class AddressNode:
+    """One declared block, range or host in the address-space tree"""
+
+    __slots__ = ('version', 'start', 'end', 'prefixlen', 'aligned', 'kind', 'meta', 'order',
+                 'parent', 'depth', 'children', 'inner', 'inner_starts')
+
+    def __init__(self, version: int, start: int, prefixlen: int, kind: str, meta: Dict[str, Any], order: int):
+        size = 1 << (ADDRESS_BITS[version] - prefixlen)
+        self.version = version
+        self.start = start & -size
+        self.end = self.start + size - 1
+        self.prefixlen = prefixlen
+        self.aligned = self.start == start
+        self.kind = kind
+        self.meta = meta
+        self.order = order
+        # YAML parentage: the enclosing block, or the version root
+        self.parent: Optional['AddressNode'] = None
+        self.depth = 0
+        self.children: List['AddressNode'] = []
+        # Containment index: aligned nodes directly inside this one, sorted by start
+        self.inner: List['AddressNode'] = []
+        self.inner_starts: List[int] = []
+
+    @property
+    def name(self) -> str:
+        return self.meta['name']
+
+    @property
+    def cidr(self) -> str:
+        return format_cidr(self.version, self.start, self.prefixlen)
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    def contains(self, other: 'AddressNode') -> bool:
+        return self.version == other.version and self.start <= other.start and other.end <= self.end
+
+    def descendants(self) -> Iterator['AddressNode']:
+        for child in self.children:
+            yield child
+            yield from child.descendants()
+
+
+class AddressSpaceTree:
+    """
+    Every address declared anywhere in ip-allocation.yaml, for IPv4 and
+    IPv6 alike, nested by YAML parentage: each node's parent is the block
+    that encloses it in the file (its `env_path`), or the version root.
+
+    One pass over the YAML collects any `cidr`, `block` or `ip` field, and
+    any other string value that is a CIDR, so new sections need no code.
+    Each node also records its YAML context: section, enclosing block
+    (`env_path`), inherited status and description. Whether a node really
+    lies inside its parent is left to validate.
+
+    Address queries use a separate containment index over the aligned
+    nodes: aligned CIDRs are either disjoint or nested, so sorting by
+    (start, -size) and keeping a stack of open nodes nests them, and the
+    nodes directly inside one never overlap. A query bisects each level's
+    sorted starts: O(depth · log n) for containment, plus k for overlaps.
+    Misaligned nodes stay out of the index, since their normalized range
+    is not what the file declares.
+    """
+
+    def __init__(self, allocations: Dict[str, Any]):
+        self.nodes: List[AddressNode] = []
+        self.roots = {version: AddressNode(version, 0, 0, 'root', {'name': f"IPv{version}"}, -1)
+                      for version in ADDRESS_BITS}
+        self.blocks: Dict[str, AddressNode] = {}
+        self._walk(allocations or {}, [], [], 'active')
+        self._link_parents()
+        self._index()
+
+    def _walk(self, value: Any, path: List[str], env_path: List[str], status: str):
+        if isinstance(value, list):
+            for index, item in enumerate(value):
+                self._walk(item, path + [str(index)], env_path, status)
+            return
+        if not isinstance(value, dict):
+            return
+
+        status = value.get('status', status)
+        own_env_path = path if isinstance(value.get('block'), str) else env_path
+        for key, child in value.items():
+            key = str(key)
+            if isinstance(child, (dict, list)):
+                self._walk(child, path + [key], own_env_path, status)
+            elif isinstance(child, str) and key != 'range' and ('/' in child or key == 'ip'):
+                self._declare(child, key, path, value, env_path if key == 'block' else own_env_path, status)
+
+    def _declare(self, text: str, key: str, path: List[str], owner: Dict[str, Any], env_path: List[str], status: str):
+        try:
+            version, start, prefixlen = parse_cidr(text)
+        except ValueError:
+            return
+        if key in ADDRESS_FIELDS:
+            name_path, description = path, owner.get('description', '')
+        else:
+            name_path, description = path + [key], ''
+        kind = 'block' if key == 'block' else 'host' if key == 'ip' else 'range'
+        range_type = kind if kind != 'range' else \
+            'secondary' if any('secondary' in part for part in name_path) else 'primary'
+        meta = {
+            'name': '/'.join(name_path),
+            'yaml_path': list(name_path),
+            'cidr_text': text,
+            'type': range_type,
+            'section': name_path[0] if name_path else '',
+            'env': env_path[-1] if env_path else None,
+            'env_path': '/'.join(env_path) if env_path else None,
+            'status': status,
+            'description': description if isinstance(description, str) else '',
+            'source': owner,
+        }
+        node = AddressNode(version, start, prefixlen, kind, meta, len(self.nodes))
+        self.nodes.append(node)
+        if kind == 'block':
+            self.blocks[meta['name']] = node
+
+    def _link_parents(self):
+        # A block key can come after the ranges it encloses, so parents are resolved once all are declared
+        for node in sorted(self.nodes, key=lambda n: (n.version, n.start, -n.size, n.order)):
+            parent = self.blocks.get(node.meta['env_path'] or '')
+            if parent is None or parent is node or parent.version != node.version:
+                parent = self.roots[node.version]
+            node.parent = parent
+            parent.children.append(node)
+        for node in self.nodes:
+            parent = node.parent
+            while parent is not None:
+                node.depth, parent = node.depth + 1, parent.parent
+
+    def _index(self):
+        stack: List[AddressNode] = []
+        for node in sorted((n for n in self.nodes if n.aligned), key=lambda n: (n.version, n.start, -n.size, n.order)):
+            if not stack or stack[0].version != node.version:
+                stack = [self.roots[node.version]]
+            while not stack[-1].contains(node):
+                stack.pop()
+            outer = stack[-1]
+            outer.inner.append(node)
+            outer.inner_starts.append(node.start)
+            stack.append(node)
+
+    def _bounds(self, cidr: str) -> Tuple[int, int, int]:
+        version, start, prefixlen = parse_cidr(cidr)
+        size = 1 << (ADDRESS_BITS[version] - prefixlen)
+        return version, start & -size, (start & -size) + size - 1
+
+    def containing(self, cidr: str) -> List[AddressNode]:
+        """Aligned declared nodes containing `cidr`, outermost first"""
+        version, start, end = self._bounds(cidr)
+        chain, node = [], self.roots[version]
+        while True:
+            i = bisect.bisect_right(node.inner_starts, start) - 1
+            if i < 0 or node.inner[i].end < end:
+                return chain
+            node = node.inner[i]
+            chain.append(node)
+
+    def overlapping(self, cidr: str) -> List[AddressNode]:
+        """Aligned declared nodes overlapping `cidr`: those containing it plus everything inside it"""
+        version, start, end = self._bounds(cidr)
+        chain = self.containing(cidr)
+        node = chain[-1] if chain else self.roots[version]
+        inside = []
+        pending = node.inner[bisect.bisect_left(node.inner_starts, start):
+                             bisect.bisect_right(node.inner_starts, end)]
+        while pending:
+            child = pending.pop()
+            inside.append(child)
+            pending.extend(child.inner)
+        inside.sort(key=lambda n: (n.start, -n.size, n.order))
+        return chain + inside
+
+    def find_block(self, name: str) -> Optional[AddressNode]:
+        """Block by YAML path (development/environments/dp-dev-01) or by its last key (dp-dev-01)"""
+        if name in self.blocks:
+            return self.blocks[name]
+        matches = [node for node in self.blocks.values() if node.meta['yaml_path'][-1] == name]
+        # The shallowest YAML path is the one a bare name most likely means
+        return min(matches, key=lambda n: (len(n.meta['yaml_path']), n.order)) if matches else None
+
+    def free_space(self, node: AddressNode) -> FreeSpaceIndex:
+        """
+        Free space of a block for allocation: its range minus everything
+        else declared in it, whichever section declares it, including the
+        normalized range of misaligned nodes to stay on the safe side.
+        """
+        taken = [(other.start, other.end) for other in self.overlapping(node.cidr)
+                 if not other.contains(node)]
+        taken.extend((other.start, other.end) for other in self.nodes
+                     if not other.aligned and other is not node and other.version == node.version
+                     and other.start <= node.end and node.start <= other.end and not other.contains(node))
+        return FreeSpaceIndex(node.version, node.start, node.prefixlen, taken)
+
+
+YAML_KEY = re.compile(r'^( *)([A-Za-z0-9_.\-]+|"[^"]*")\s*:(?:\s|$)')
+
+
+def _find_yaml_mapping(lines: List[str], path: List[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """
+    Locate the mapping at `path` in YAML text lines: (indent, end, child indent),
+    where `end` is the index just after its last content line. The last
+    occurrence wins, as it does for yaml.safe_load with duplicate keys.
+    """
+    stack: List[Tuple[int, str]] = []
+    found = None
+    for n, line in enumerate(lines):
+        match = YAML_KEY.match(line)
+        if not match:
+            continue
+        indent = len(match.group(1))
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        stack.append((indent, match.group(2).strip('"')))
+        if len(stack) == len(path) and all(key == want for (_, key), want in zip(stack, path)):
+            found = (n, indent)
+    if found is None:
+        return None
+
+    n, indent = found
+    end, child_indent = n + 1, None
+    for k in range(n + 1, len(lines)):
+        stripped = lines[k].strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        line_indent = len(lines[k]) - len(lines[k].lstrip(' '))
+        if line_indent <= indent:
+            break
+        if child_indent is None:
+            child_indent = line_indent
+        end = k + 1
+    return indent, end, child_indent
+
+
+def insert_yaml_entry(text: str, path: List[str], name: str, fields: Dict[str, Any]) -> str:
+    """
+    Add `name: {fields}` under the mapping at `path`, editing the text so
+    comments and layout of the rest of the file are kept. Missing parent
+    mappings are created. Raises ValueError if path[0] does not exist.
+    """
+    lines = text.splitlines(keepends=True)
+    depth = len(path)
+    while depth and _find_yaml_mapping(lines, path[:depth]) is None:
+        depth -= 1
+    if depth == 0:
+        raise ValueError(f"section '{path[0]}' not found")
+
+    indent, end, child_indent = _find_yaml_mapping(lines, path[:depth])
+    step = child_indent - indent if child_indent is not None else 2
+    level = indent + step
+    new_lines = []
+    for key in path[depth:]:
+        new_lines.append(f"{' ' * level}{key}:\n")
+        level += step
+    new_lines.append(f"{' ' * level}{name}:\n")
+    for key, value in fields.items():
+        rendered = json.dumps(value) if isinstance(value, str) else str(value)
+        new_lines.append(f"{' ' * (level + step)}{key}: {rendered}\n")
+
+    if end and not lines[end - 1].endswith('\n'):
+        lines[end - 1] += '\n'
+    lines[end:end] = new_lines
+    return ''.join(lines)
+
 
 class IPAllocationChecker:
-    def __init__(self, allocation_file: str = "../ip-allocation.yaml"):
+    def __init__(self, allocation_file: str = "../ip-allocation.yaml", cache_file: Optional[str] = None):
         """Initialize the IP allocation checker."""
         self.allocation_file = allocation_file
+        self.cache_file = cache_file
+        self.allocation_path = os.path.join(SCRIPT_DIR, allocation_file)
         self.allocations = self._load_allocations()
-        self.networks = []
         self._parse_networks()
 
     def _load_allocations(self) -> Dict:
         """Load IP allocations from YAML file."""
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, self.allocation_file)
+        file_path = self.allocation_path
 
         try:
-            with open(file_path, 'r') as f:
-                return yaml.safe_load(f)
+            with open(file_path, 'rb') as f:
+                raw = f.read()
         except FileNotFoundError:
             print(f"Error: Could not find {file_path}")
             sys.exit(1)
+
+        key = (PARSED_CACHE_VERSION, marshal.version, hashlib.sha256(raw).hexdigest())
+        cached = self._load_parsed_cache(key)
+        if cached is not None:
+            return cached
+
+        try:
+            allocations = yaml.load(raw, Loader=YAML_LOADER)
         except yaml.YAMLError as e:
             print(f"Error parsing YAML: {e}")
             sys.exit(1)
+        self._save_parsed_cache(key, allocations)
+        return allocations
+
+    def _load_parsed_cache(self, key: Tuple) -> Optional[Dict]:
+        """Parsed allocations from the cache file if it was written for the same key"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, 'rb') as f:
+                cached_key, allocations = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            print(f"Warning: ignoring unreadable cache {self.cache_file}: {e}", file=sys.stderr)
+            return None
+        return allocations if tuple(cached_key) == key else None
+
+    def _save_parsed_cache(self, key: Tuple, allocations: Dict):
+        """Atomically write the parsed allocations; marshal only handles plain YAML types"""
+        if not self.cache_file:
+            return
+        try:
+            data = marshal.dumps((key, allocations))
+        except ValueError as e:
+            print(f"Warning: not caching {self.allocation_path}: {e}", file=sys.stderr)
+            return
+        try:
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"Warning: could not write cache {self.cache_file}: {e}", file=sys.stderr)
 
     def _parse_networks(self):
-        """Parse all networks from the allocation data."""
-        # Parse development environments
-        dev_envs = self.allocations.get('development', {}).get('environments', {})
-        self._parse_environment_networks(dev_envs, 'development')
-
-        # Parse perimeter environments
-        perimeter_envs = self.allocations.get('perimeter', {}).get('environments', {})
-        self._parse_environment_networks(perimeter_envs, 'perimeter')
-
-        # Parse production environments
-        prod_envs = self.allocations.get('production', {}).get('environments', {})
-        self._parse_environment_networks(prod_envs, 'production')
-
-    def _parse_environment_networks(self, envs: Dict, env_type: str):
-        """Parse networks for a specific environment type."""
-        for env_name, env_data in envs.items():
-            if env_data.get('status') in ['active', 'reserved']:
-                # Parse primary subnets
-                for subnet_name, subnet_data in env_data.get('primary_subnets', {}).items():
-                    if 'cidr' in subnet_data:
-                        self.networks.append({
-                            'name': f"{env_type}/{env_name}/{subnet_name}",
-                            'network': ipaddress.IPv4Network(subnet_data['cidr']),
-                            'type': 'primary',
-                            'env': env_name,
-                            'env_type': env_type,
-                            'description': subnet_data.get('description', '')
-                        })
-
-                # Parse secondary ranges (for GKE)
-                for range_name, range_data in env_data.get('secondary_ranges', {}).items():
-                    if 'cidr' in range_data:
-                        self.networks.append({
-                            'name': f"{env_type}/{env_name}/{range_name}",
-                            'network': ipaddress.IPv4Network(range_data['cidr']),
-                            'type': 'secondary',
-                            'env': env_name,
-                            'env_type': env_type,
-                            'description': range_data.get('description', '')
-                        })
+        """
+        Build the address-space tree and the range table from the allocation data.
+
+        The range table holds every declared subnet and secondary range (not
+        blocks or single hosts) with its YAML context for validation.
+        """
+        self.tree = AddressSpaceTree(self.allocations)
+        self.ranges = RangeTable()
+        for node in self.tree.nodes:
+            if node.kind == 'range':
+                self.ranges.add(node.meta['cidr_text'], **node.meta)
 
     def validate(self) -> bool:
         """Validate IP allocations for conflicts."""
         print("🔍 Validating IP allocations...\n")
 
+        ranges = self.ranges
         conflicts = []
         valid = True
 
         # Check for overlapping networks
-        for i, net1 in enumerate(self.networks):
-            for net2 in self.networks[i+1:]:
-                if net1['network'].overlaps(net2['network']):
-                    conflicts.append((net1, net2))
-                    valid = False
-
+        conflicts = ranges.overlapping_pairs()
         if conflicts:
-            print("❌ Found IP conflicts:")
-            for net1, net2 in conflicts:
-                print(f"\n  Conflict between:")
-                print(f"    - {net1['name']}: {net1['network']}")
-                print(f"    - {net2['name']}: {net2['network']}")
+            valid = False
+            print(f"❌ Found {len(conflicts)} IP conflicts:")
+            for i, j in conflicts:
+                row_i, row_j = ranges.rows[i], ranges.rows[j]
+                note = ""
+                # Each environment is one VPC, so a secondary range may not reuse its primary space
+                if row_i['env'] == row_j['env'] and {row_i['type'], row_j['type']} == {'primary', 'secondary'}:
+                    note = " (secondary range overlaps a primary subnet in the same VPC)"
+                print(f"\n  Conflict between{note}:")
+                print(f"    - {row_i['name']}: {ranges.cidr(i)}")
+                print(f"    - {row_j['name']}: {ranges.cidr(j)}")
         else:
             print("✅ No IP conflicts found!")
 
-        # Validate CIDR boundaries
+        # Every range and nested block must sit inside the block that encloses it in the YAML;
+        # a misaligned block has no well-defined range and is reported by the boundary check below
+        print("\n🔍 Checking environment blocks...")
+        outside = []
+        for node in self.tree.nodes:
+            block = node.parent
+            if node.kind == 'host' or block.kind == 'root' or not block.aligned:
+                continue
+            if not block.contains(node):
+                outside.append(f"{node.name}: {node.cidr} is outside environment block "
+                               f"{block.cidr} ({block.name})")
+        if outside:
+            valid = False
+            print("❌ Ranges outside their environment block:")
+            for issue in outside:
+                print(f"    - {issue}")
+        else:
+            print("✅ All ranges are inside their environment block!")
+
+        # Validate CIDR boundaries: a range must start on a multiple of its size
         print("\n🔍 Checking CIDR boundaries...")
         boundary_issues = []
-        for net in self.networks:
-            network = net['network']
-            prefix = network.prefixlen
-
-            # Check alignment based on prefix length
-            if prefix == 21:
-                # /21 must be divisible by 8
-                third_octet = int(str(network.network_address).split('.')[2])
-                if third_octet % 8 != 0:
-                    boundary_issues.append(f"{net['name']}: /21 not aligned (third octet {third_octet} not divisible by 8)")
-            elif prefix == 18:
-                # /18 must be divisible by 64
-                third_octet = int(str(network.network_address).split('.')[2])
-                if third_octet % 64 != 0:
-                    boundary_issues.append(f"{net['name']}: /18 not aligned (third octet {third_octet} not divisible by 64)")
-            elif prefix == 19:
-                # /19 must be divisible by 32
-                third_octet = int(str(network.network_address).split('.')[2])
-                if third_octet % 32 != 0:
-                    boundary_issues.append(f"{net['name']}: /19 not aligned (third octet {third_octet} not divisible by 32)")
+        for i in ranges.misaligned():
+            version, size = ranges.versions[i], ranges.size(i)
+            aligned = format_cidr(version, ranges.starts[i] & -size, ranges.prefixlens[i])
+            boundary_issues.append(f"{ranges.rows[i]['name']}: {ranges.cidr(i)} not aligned "
+                                   f"(start is not a multiple of {size:,} addresses; did you mean {aligned}?)")
+        for node in self.tree.blocks.values():
+            if not node.aligned:
+                boundary_issues.append(f"{node.name}: {node.meta['cidr_text']} not aligned "
+                                       f"(start is not a multiple of {node.size:,} addresses; "
+                                       f"did you mean {node.cidr}?)")
 
         if boundary_issues:
             print("⚠️  CIDR boundary issues found:")
@@ -152,52 +655,446 @@ class IPAllocationChecker:
 
         return valid
 
+    def free_space(self, env: str) -> Optional[FreeSpaceIndex]:
+        """Free-space index of a block (by name or YAML path), treating everything declared in it as taken"""
+        node = self.tree.find_block(env)
+        return self.tree.free_space(node) if node else None
+
+    def allocate(self, env: str, name: str, prefixlen: int, kind: str = 'primary',
+                 description: str = '', dry_run: bool = False) -> str:
+        """
+        Reserve the best-fit free /prefixlen in `env`'s block and write it to
+        the allocation file: a primary subnet `name`, or the pods/services
+        range of cluster `name`. Returns the CIDR; raises ValueError when the
+        request cannot be met.
+        """
+        node = self.tree.find_block(env)
+        if node is None:
+            raise ValueError(f"environment {env} not found")
+        if not node.aligned:
+            raise ValueError(f"block {node.name} ({node.meta['cidr_text']}) is not aligned; fix it before allocating")
+
+        env_data = node.meta['source']
+        if kind == 'primary':
+            keys = ['primary_subnets']
+        else:
+            keys = ['gke_secondary_ranges', kind]
+        path = node.meta['yaml_path'] + keys
+        existing = env_data
+        for key in keys:
+            existing = existing.get(key) or {}
+        if name in existing:
+            raise ValueError(f"{'/'.join(path + [name])} is already allocated")
+
+        index = self.tree.free_space(node)
+        start = index.allocate(prefixlen)
+        if start is None:
+            raise ValueError(f"no free /{prefixlen} left in {env}")
+
+        version = index.version
+        size = 1 << (ADDRESS_BITS[version] - prefixlen)
+        cidr = format_cidr(version, start, prefixlen)
+        first, last = (format_cidr(version, address, ADDRESS_BITS[version]).split('/')[0]
+                       for address in (start, start + size - 1))
+        fields = {'cidr': cidr, 'range': f"{first} - {last}", 'size': size}
+        if kind == 'primary':
+            fields['description'] = description
+        else:
+            fields['status'] = 'allocated'
+            if description:
+                fields['description'] = description
+
+        if not dry_run:
+            with open(self.allocation_path, 'r') as f:
+                text = insert_yaml_entry(f.read(), path, name, fields)
+            tmp_path = self.allocation_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(text)
+            os.replace(tmp_path, self.allocation_path)
+
+        # Mirror the write in memory so further calls see the allocation
+        target = env_data
+        for key in keys:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        target[name] = fields
+        self._parse_networks()
+        return cidr
+
+    def iter_declared_ranges(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every declared range and host in ip-allocation.yaml, plus the
+        leaf blocks: aligned blocks with no smaller block inside them, i.e.
+        the most specific environment blocks. Enclosing blocks (a section's
+        /8) cover whole families of environments, so counting them would
+        make any address look declared. Each entry has name, network, kind,
+        section, env, status and the set of YAML keys on its path.
+        """
+        for node in self.tree.nodes:
+            if node.kind == 'block':
+                if not node.aligned or any(other.kind == 'block' and other.size < node.size
+                                           for other in self.tree.overlapping(node.cidr)):
+                    continue
+            yield {'name': node.name, 'network': ipaddress.ip_network(node.cidr), 'kind': node.meta['type'],
+                   'section': node.meta['section'], 'env': node.meta['env'], 'status': node.meta['status'],
+                   'path_parts': set(node.meta['yaml_path'])}
+
+    def environment_blocks(self) -> Dict[str, Any]:
+        """Block name (last YAML key) → network, resolved like find_block"""
+        blocks = {}
+        for node in self.tree.blocks.values():
+            name = node.meta['yaml_path'][-1]
+            blocks[name] = ipaddress.ip_network(self.tree.find_block(name).cidr)
+        return blocks
+
+    def reconcile(self, usages: Dict[str, List[Dict]],
+                  cross_env_sections: Tuple[str, ...] = CROSS_ENV_SECTIONS) -> Dict[str, Any]:
+        """
+        Join declared ranges with actual usages and report drift.
+
+        `usages` maps an IP or CIDR to its locations (the `allocations` of
+        track-ip-allocations' IPAllocationTracker). Only usages inside
+        ALLOCATABLE_SPACE are reconciled. A usage's environment is the last
+        (most specific) path segment of its file that names a declared block.
+
+        A usage no range, host or leaf block covers is undeclared. A covered
+        usage outside its own environment block is reported as outside,
+        unless one of the declarations covering it belongs to that
+        environment or to a section in `cross_env_sections`.
+
+        Declared ranges and usages go into one list sorted by (start, -end),
+        so every declared range that contains a usage is open when the usage
+        is reached. A heap drops ranges that have ended. O(n log n) plus the
+        nesting depth per usage.
+        """
+        env_blocks = self.environment_blocks()
+        declared = list(self.iter_declared_ranges())
+
+        def usage_env(file_path: str) -> Optional[str]:
+            for part in reversed(Path(file_path).parts):
+                if part in env_blocks:
+                    return part
+            return None
+
+        usage_list = []
+        for ip_str, locations in usages.items():
+            try:
+                network = ipaddress.ip_network(ip_str, strict=False)
+            except ValueError:
+                continue
+            if not any(network.version == space.version and network.subnet_of(space)
+                       for space in ALLOCATABLE_SPACE):
+                continue
+            for location in locations:
+                usage_list.append({'network': network, 'location': location, 'env': usage_env(location['file'])})
+
+        # Declared ranges sort before usages with the same bounds (kind 0 < 1)
+        events = []
+        for index, entry in enumerate(declared):
+            version, start, end = address_range(entry['network'])
+            events.append((version, start, -end, 0, index))
+        for index, usage in enumerate(usage_list):
+            version, start, end = address_range(usage['network'])
+            events.append((version, start, -end, 1, index))
+        events.sort()
+
+        used = [False] * len(declared)
+        containing = [[] for _ in usage_list]
+        active = []
+        current_version = None
+        for version, start, neg_end, kind, index in events:
+            if version != current_version:
+                active, current_version = [], version
+            while active and active[0][0] < start:
+                heapq.heappop(active)
+            if kind == 0:
+                heapq.heappush(active, (-neg_end, index))
+                continue
+            for end, declared_index in active:
+                if end >= -neg_end:
+                    containing[index].append(declared_index)
+                    used[declared_index] = True
+
+        undeclared, outside = [], []
+        for usage, matches in zip(usage_list, containing):
+            location = usage['location']
+            entry = {'network': str(usage['network']), 'file': location['file'],
+                     'line': location.get('line'), 'context': location.get('context'), 'env': usage['env']}
+            if not matches:
+                undeclared.append(entry)
+                continue
+            env = usage['env']
+            if env is None:
+                continue
+            network, block = usage['network'], env_blocks[env]
+            if network.version == block.version and network.subnet_of(block):
+                continue
+            # PSA ranges and the like live outside the block but are declared for the environment
+            if any(declared[i]['section'] in cross_env_sections or declared[i]['env'] == env
+                   or env in declared[i]['path_parts'] for i in matches):
+                continue
+            outside.append({**entry, 'env_block': str(block),
+                            'declared_as': [declared[i]['name'] for i in matches]})
+
+        unused = [
+            {'name': entry['name'], 'network': str(entry['network']), 'kind': entry['kind'], 'status': entry['status']}
+            for entry, is_used in zip(declared, used)
+            if not is_used and entry['status'] not in ('reserved', 'planned')
+        ]
+
+        return {
+            'summary': {
+                'declared_ranges': len(declared),
+                'usages': len(usage_list),
+                'undeclared_usages': len(undeclared),
+                'unused_declarations': len(unused),
+                'outside_env_block': len(outside)
+            },
+            'undeclared_usages': undeclared,
+            'unused_declarations': unused,
+            'outside_env_block': outside
+        }
+
+    def print_reconciliation(self, result: Dict[str, Any]):
+        """Print a reconcile result"""
+        summary = result['summary']
+        print("🔍 Reconciling ip-allocation.yaml with live/ usages...\n")
+        print(f"  Declared ranges: {summary['declared_ranges']}")
+        print(f"  Usages found:    {summary['usages']}")
+
+        if result['undeclared_usages']:
+            print(f"\n❌ Usages not covered by any declaration ({summary['undeclared_usages']}):")
+            for usage in result['undeclared_usages']:
+                print(f"    - {usage['network']:<18} {self._usage_location(usage)}")
+        else:
+            print("\n✅ Every usage is covered by a declaration")
+
+        if result['unused_declarations']:
+            print(f"\n⚠️  Declared but unused ({summary['unused_declarations']}):")
+            for entry in result['unused_declarations']:
+                print(f"    - {entry['name']:<45} {entry['network']}")
+        else:
+            print("\n✅ Every active declaration is in use")
+
+        if result['outside_env_block']:
+            print(f"\n❌ Usages outside their environment block ({summary['outside_env_block']}):")
+            for usage in result['outside_env_block']:
+                print(f"    - {usage['network']:<18} {usage['env']} {usage['env_block']}: "
+                      f"{self._usage_location(usage)} (declared as {', '.join(usage['declared_as'])})")
+        else:
+            print("\n✅ Every usage is inside its environment block")
+
+    @staticmethod
+    def _usage_location(usage: Dict[str, Any]) -> str:
+        line = f":{usage['line']}" if usage.get('line') else ""
+        return f"{usage['file']}{line} ({usage['context']})"
+
+    def capacity_report(self) -> Dict[str, Any]:
+        """
+        Utilization and fragmentation of every declared block, and
+        utilization of every IPv4 /16 holding declared ranges.
+
+        A block's allocations are its own YAML children (clipped to the
+        block), so one sorted pass over them gives its allocated space and
+        gaps, and its free aligned blocks per prefix length come from the
+        buddy free lists of FreeSpaceIndex. Misaligned children are left
+        out. Blocks whose numbers would mislead are listed as skipped
+        instead: misaligned blocks, whose declared range is ambiguous,
+        repeats of a range declared more specifically elsewhere, and blocks
+        that contain other declared blocks from elsewhere in the file,
+        which their own allocations do not account for. For the /16s,
+        the aligned subnet and secondary ranges are merged and cut at /16
+        boundaries in one sweep.
+        """
+        # A range declared as several blocks (global summary, section, environment) is reported once,
+        # on its most specific declaration
+        representative: Dict[Tuple[int, int, int], AddressNode] = {}
+        for node in self.tree.blocks.values():
+            key = (node.version, node.start, node.prefixlen)
+            best = representative.get(key)
+            if best is None or (node.depth, len(node.children), -node.order) > \
+                    (best.depth, len(best.children), -best.order):
+                representative[key] = node
+
+        blocks, skipped = [], []
+        for name, node in sorted(self.tree.blocks.items()):
+            if not node.aligned:
+                skipped.append({'name': name, 'cidr': node.meta['cidr_text'], 'reason': 'misaligned'})
+                continue
+            same = representative[(node.version, node.start, node.prefixlen)]
+            if same is not node:
+                skipped.append({'name': name, 'cidr': node.cidr, 'reason': f"same range as {same.name}"})
+                continue
+            foreign = [other.name for other in self.tree.overlapping(node.cidr)
+                       if other.kind == 'block' and other.size < node.size and not self._descends_from(other, node)]
+            if foreign:
+                skipped.append({'name': name, 'cidr': node.cidr, 'reason': 'contains other blocks',
+                                'blocks': foreign})
+                continue
+
+            own = sorted((max(child.start, node.start), min(child.end, node.end)) for child in node.children
+                         if child.aligned and child.start <= node.end and node.start <= child.end)
+            gaps, cursor = [], node.start
+            for start, end in own:
+                if start > cursor:
+                    gaps.append(start - cursor)
+                cursor = max(cursor, end + 1)
+            if cursor <= node.end:
+                gaps.append(node.end + 1 - cursor)
+            free = sum(gaps)
+
+            index = FreeSpaceIndex(node.version, node.start, node.prefixlen, own)
+            largest = index.largest_free()
+            bits = ADDRESS_BITS[node.version]
+            free_aligned = {}
+            for prefixlen in range(node.prefixlen, max(node.prefixlen, REPORT_MAX_PREFIXLEN[node.version]) + 1):
+                count = sum(len(index.free[p]) << (prefixlen - p) for p in range(node.prefixlen, prefixlen + 1))
+                if count:
+                    free_aligned[f"/{prefixlen}"] = count
+            largest_size = 1 << (bits - largest[1]) if largest else 0
+
+            blocks.append({
+                'name': name,
+                'cidr': node.cidr,
+                'status': node.meta['status'],
+                'size': node.size,
+                'allocated': node.size - free,
+                'free': free,
+                'utilization': round((node.size - free) / node.size, 4),
+                'gaps': {'count': len(gaps), 'largest': max(gaps, default=0), 'smallest': min(gaps, default=0)},
+                # 0 when all free space is one aligned block, towards 1 as it splinters
+                'fragmentation': round(1 - largest_size / free, 4) if free else 0.0,
+                'largest_free_block': format_cidr(node.version, *largest) if largest else None,
+                'free_aligned_blocks': free_aligned,
+            })
+
+        # Merge the aligned IPv4 subnet/secondary ranges, then cut them at /16 boundaries
+        intervals = sorted((node.start, node.end) for node in self.tree.nodes
+                           if node.kind == 'range' and node.version == 4 and node.aligned)
+        per_slash16: Dict[int, int] = defaultdict(int)
+        merged_start = merged_end = None
+        for start, end in intervals + [(None, None)]:
+            if start is not None and merged_end is not None and start <= merged_end + 1:
+                merged_end = max(merged_end, end)
+                continue
+            if merged_start is not None:
+                cursor = merged_start
+                while cursor <= merged_end:
+                    slash16 = cursor >> 16
+                    chunk_end = min(merged_end, (slash16 << 16) + 0xFFFF)
+                    per_slash16[slash16] += chunk_end - cursor + 1
+                    cursor = chunk_end + 1
+            merged_start, merged_end = start, end
+
+        slash16s = [{'cidr': format_cidr(4, slash16 << 16, 16), 'allocated': allocated,
+                     'free': (1 << 16) - allocated, 'utilization': round(allocated / (1 << 16), 4)}
+                    for slash16, allocated in sorted(per_slash16.items())]
+
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'summary': {
+                'blocks': len(blocks),
+                'skipped_blocks': len(skipped),
+                'ranges': len(self.ranges),
+                'allocated_ipv4_addresses': sum(per_slash16.values()),
+                'slash16s_in_use': len(slash16s),
+            },
+            'blocks': blocks,
+            'skipped_blocks': skipped,
+            'slash16': slash16s,
+        }
+
+    @staticmethod
+    def _descends_from(node: AddressNode, ancestor: AddressNode) -> bool:
+        """Whether `ancestor` encloses `node` in the YAML"""
+        parent = node.parent
+        while parent is not None:
+            if parent is ancestor:
+                return True
+            parent = parent.parent
+        return False
+
+    def print_capacity_report(self, report: Dict[str, Any]):
+        """Print a capacity report with per-block bars and a /16 heatmap for each IPv4 /8 in use"""
+        def bar(utilization: float, width: int = 20) -> str:
+            filled = round(utilization * width)
+            return '█' * filled + '░' * (width - filled)
+
+        print("📈 IP Capacity Report\n")
+        print(f"  {'Block':<40} {'CIDR':<18} {'Utilization':<28} {'Gaps':>5} {'Frag':>5}  Largest free")
+        for block in report['blocks']:
+            print(f"  {block['name']:<40} {block['cidr']:<18} {bar(block['utilization'])} "
+                  f"{block['utilization'] * 100:>5.1f}% {block['gaps']['count']:>5} "
+                  f"{block['fragmentation']:>5.2f}  {block['largest_free_block'] or '-'}")
+        if report['skipped_blocks']:
+            print("\n  ⚠️  Not reported (utilization would be misleading):")
+            for block in report['skipped_blocks']:
+                print(f"    - {block['name']:<38} {block['cidr']:<18} {block['reason']}")
+
+        by_slash8 = defaultdict(dict)
+        for entry in report['slash16']:
+            octets = entry['cidr'].split('/')[0].split('.')
+            by_slash8[int(octets[0])][int(octets[1])] = entry['utilization']
+
+        for first_octet, cells in sorted(by_slash8.items()):
+            print(f"\n  /16 heatmap for {first_octet}.0.0.0/8 "
+                  f"(row = second octet / 16, {HEATMAP_SHADES[0]} empty, {HEATMAP_SHADES[-1]} ≥75% used)")
+            print("        " + "".join(f"{column:<3x}" for column in range(16)))
+            for row in range(16):
+                line = ""
+                for column in range(16):
+                    utilization = cells.get(row * 16 + column, 0.0)
+                    shade = 0 if utilization == 0 else min(len(HEATMAP_SHADES) - 1, 1 + int(utilization * 4))
+                    line += HEATMAP_SHADES[shade] * 2 + " "
+                print(f"    {row * 16:>3} {line}")
+
     def visualize(self):
         """Visualize IP allocations."""
         print("📊 IP Allocation Visualization\n")
 
-        # Group by environment type
+        # Group by YAML section, then by enclosing block
+        ranges = self.ranges
         by_type = defaultdict(lambda: defaultdict(list))
-        for net in sorted(self.networks, key=lambda x: x['network'].network_address):
-            by_type[net['env_type']][net['env']].append(net)
+        for i in sorted(range(len(ranges)), key=lambda i: (ranges.versions[i], ranges.starts[i])):
+            by_type[ranges.rows[i]['section']][ranges.rows[i]['env_path']].append(i)
+
+        def label(row: Dict[str, Any]) -> str:
+            # Path below the environment, without the container key (primary_subnets, gke_secondary_ranges, ...)
+            depth = len(row['env_path'].split('/')) if row['env_path'] else 0
+            parts = row['yaml_path'][depth:]
+            return '/'.join(parts[1:] if len(parts) > 1 else parts)
 
-        for env_type in ['development', 'perimeter', 'production']:
+        for env_type in self.allocations:
             if env_type in by_type:
-                print(f"\n🌐 {env_type.upper()} Environments")
+                print(f"\n🌐 {str(env_type).upper()} Environments")
                 print("  " + "=" * 70)
 
-                type_data = self.allocations.get(env_type, {})
-                if 'block' in type_data:
-                    print(f"  Block: {type_data['block']} ({type_data.get('total_ips', 'N/A'):,} IPs)")
+                section_block = self.tree.blocks.get(env_type)
+                if section_block:
+                    print(f"  Block: {section_block.meta['cidr_text']} ({section_block.size:,} IPs)")
 
-                for env, nets in by_type[env_type].items():
-                    print(f"\n  📁 Environment: {env}")
+                for env_path, nets in by_type[env_type].items():
+                    env_block = self.tree.blocks.get(env_path or '')
+                    env_name = env_path.split('/')[-1] if env_path else '(no block)'
+                    print(f"\n  📁 Environment: {env_name}")
                     print("  " + "─" * 60)
 
                     # Show environment block
-                    env_data = type_data.get('environments', {}).get(env, {})
-                    if 'block' in env_data:
-                        print(f"    Block: {env_data['block']} ({env_data.get('total_ips', 'N/A'):,} IPs)")
-                        print(f"    Status: {env_data.get('status', 'unknown')}")
+                    if env_block and env_block is not section_block:
+                        print(f"    Block: {env_block.meta['cidr_text']} ({env_block.size:,} IPs)")
+                        print(f"    Status: {env_block.meta['status']}")
 
                     # Show subnets
-                    primary_nets = [n for n in nets if n['type'] == 'primary']
-                    if primary_nets:
-                        print("\n    Primary Subnets:")
-                        for net in primary_nets:
-                            name_part = net['name'].split('/')[-1]
-                            print(f"      {name_part:<20} {str(net['network']):<18} "
-                                  f"({net['network'].num_addresses:>6,} IPs)")
-                            if net['description']:
-                                print(f"        └─ {net['description']}")
-
-                    secondary_nets = [n for n in nets if n['type'] == 'secondary']
-                    if secondary_nets:
-                        print("\n    Secondary Ranges (GKE):")
-                        for net in secondary_nets:
-                            name_part = net['name'].split('/')[-1]
-                            print(f"      {name_part:<20} {str(net['network']):<18} "
-                                  f"({net['network'].num_addresses:>6,} IPs)")
+                    for range_type, title in (('primary', 'Primary Subnets'), ('secondary', 'Secondary Ranges (GKE)')):
+                        typed = [i for i in nets if ranges.rows[i]['type'] == range_type]
+                        if not typed:
+                            continue
+                        print(f"\n    {title}:")
+                        for i in typed:
+                            net = ranges.rows[i]
+                            print(f"      {label(net):<20} {ranges.cidr(i):<18} "
+                                  f"({ranges.size(i):>6,} IPs)")
                             if net['description']:
                                 print(f"        └─ {net['description']}")
 
@@ -205,92 +1102,106 @@ class IPAllocationChecker:
         """Show available IP blocks."""
         print("🆓 Available IP Allocations\n")
 
-        # Show development block
-        dev_block = ipaddress.IPv4Network(self.allocations['development']['block'])
-        print(f"Development Block: {dev_block} ({dev_block.num_addresses:,} total IPs)")
-
-        # Show reserved environments
-        print("\nReserved Development Environments (ready for use):")
-        dev_envs = self.allocations['development']['environments']
-        for env_name, env_data in dev_envs.items():
-            if env_data.get('status') == 'reserved':
-                print(f"  - {env_name}: {env_data['block']} ({env_data.get('total_ips', 65536):,} IPs)")
-
-        # Show perimeter block
-        perimeter_block = ipaddress.IPv4Network(self.allocations['perimeter']['block'])
-        print(f"\nPerimeter Block: {perimeter_block} ({perimeter_block.num_addresses:,} total IPs)")
-
-        # Show production block
-        prod_block = ipaddress.IPv4Network(self.allocations['production']['block'])
-        print(f"\nProduction Block: {prod_block} ({prod_block.num_addresses:,} total IPs)")
-
-        # Calculate next available environment
-        used_blocks = []
-        for env_data in dev_envs.values():
-            if 'block' in env_data:
-                used_blocks.append(ipaddress.IPv4Network(env_data['block']))
-
-        print(f"\nNext available environment blocks:")
-        next_base = 10
-        next_third = 136  # After dev-04 (10.135.0.0/16)
-        for i in range(5):
-            candidate = ipaddress.IPv4Network(f"{next_base}.{next_third}.0.0/16")
-            if not any(candidate.overlaps(used) for used in used_blocks):
-                print(f"  - dev-{len(dev_envs)+i+1:02d}: {candidate}")
-            next_third += 1
+        # Top-level section blocks, whichever sections the file has
+        sections = [node for node in self.tree.blocks.values() if node.parent.kind == 'root'
+                    and node.meta['yaml_path'] == [node.meta['section']]]
+        for node in sections:
+            print(f"Block {node.name}: {node.meta['cidr_text']} ({node.size:,} total IPs)")
+
+        # Show reserved blocks nested in a section
+        reserved = [node for node in self.tree.blocks.values()
+                    if node.meta['status'] == 'reserved' and node.parent.kind == 'block']
+        if reserved:
+            print("\nReserved blocks (ready for use):")
+            for node in reserved:
+                print(f"  - {node.name}: {node.meta['cidr_text']} ({node.size:,} IPs)")
+
+        # Show free space inside every declared block, in any section
+        print("\nFree space in declared blocks:")
+        for name, node in sorted(self.tree.blocks.items()):
+            index = self.tree.free_space(node)
+            largest = index.largest_free()
+            largest_text = format_cidr(index.version, *largest) if largest else "none"
+            print(f"  - {name:<40} {index.free_addresses():>10,} free IPs, largest free block {largest_text}")
+
+        # Next environment blocks: best-fit free blocks of the usual environment size in each section
+        print("\nNext available environment blocks:")
+        for node in sections:
+            prefixes = [child.prefixlen for child in node.children if child.kind == 'block']
+            if not prefixes:
+                continue
+            if not node.aligned:
+                print(f"  - {node.name}: block {node.meta['cidr_text']} is not aligned; fix it to see free blocks")
+                continue
+            prefixlen = max(set(prefixes), key=prefixes.count)
+            index = self.tree.free_space(node)
+            starts = []
+            while len(starts) < 5:
+                start = index.allocate(prefixlen)
+                if start is None:
+                    break
+                starts.append(start)
+            free_text = ", ".join(format_cidr(index.version, start, prefixlen) for start in sorted(starts)) or "none"
+            print(f"  - {node.name}: {free_text}")
 
     def suggest_next_cluster(self, env: str = 'dp-dev-01'):
         """Suggest next available cluster allocation."""
         print(f"🔮 Next available allocations for {env}\n")
 
-        # Search in all environment types
-        for env_type in ['development', 'perimeter', 'production']:
-            env_data = self.allocations.get(env_type, {}).get('environments', {}).get(env)
-            if env_data:
-                break
-        else:
+        env_node = self.tree.find_block(env)
+        if env_node is None:
             print(f"Environment {env} not found!")
             return
+        env_data = env_node.meta['source']
 
-        # Find next cluster ranges
-        secondary_ranges = env_data.get('secondary_ranges', {})
-
-        # Count allocated clusters
-        allocated_clusters = set()
-        for range_name in secondary_ranges.keys():
-            if '-' in range_name:
-                cluster_name = range_name.split('-')[0] + '-' + range_name.split('-')[1]
-                allocated_clusters.add(cluster_name)
+        # Collect cluster ranges from both layouts: secondary_ranges["cluster-NN-pods"]
+        # and gke_secondary_ranges.pods["cluster-NN"]
+        cluster_ranges = defaultdict(dict)
+        for range_name, range_data in (env_data.get('secondary_ranges') or {}).items():
+            cluster_name, _, range_type = range_name.rpartition('-')
+            if cluster_name and range_type in ('pods', 'services'):
+                cluster_ranges[cluster_name][range_type] = range_data
+        for range_type, clusters in (env_data.get('gke_secondary_ranges') or {}).items():
+            for cluster_name, range_data in (clusters or {}).items():
+                cluster_ranges[cluster_name][range_type] = range_data
 
+        allocated_clusters = {name for name, ranges in cluster_ranges.items()
+                              if any(r.get('status', 'allocated') != 'reserved' for r in ranges.values())}
         next_cluster_num = len(allocated_clusters) + 1
         next_cluster_name = f"cluster-{next_cluster_num:02d}"
 
         print(f"Next cluster: {next_cluster_name}")
 
-        # Check if ranges are pre-allocated
-        pod_range_name = f"{next_cluster_name}-pods"
-        service_range_name = f"{next_cluster_name}-services"
-
-        if pod_range_name in secondary_ranges:
-            pod_data = secondary_ranges[pod_range_name]
-            print(f"  Pod range:     {pod_data['cidr']} ({pod_data['size']:,} IPs)")
-        else:
-            print(f"  Pod range:     Not pre-allocated")
-
-        if service_range_name in secondary_ranges:
-            service_data = secondary_ranges[service_range_name]
-            print(f"  Service range: {service_data['cidr']} ({service_data['size']:,} IPs)")
-        else:
-            print(f"  Service range: Not pre-allocated")
-
-        if pod_range_name not in secondary_ranges:
-            print("\nNo more pre-allocated cluster ranges available.")
-            print("Additional ranges need to be defined in ip-allocation.yaml")
+        # Pre-allocated ranges win; otherwise propose free space sized like the existing clusters
+        index = self.free_space(env)
+        for range_type, label in (('pods', 'Pod range:    '), ('services', 'Service range:')):
+            pre_allocated = cluster_ranges.get(next_cluster_name, {}).get(range_type)
+            if pre_allocated:
+                print(f"  {label} {pre_allocated['cidr']} ({pre_allocated.get('size', 0):,} IPs, pre-allocated)")
+                continue
+            prefixes = [parse_cidr(r[range_type]['cidr'])[2] for r in cluster_ranges.values() if range_type in r]
+            if index is None or not prefixes:
+                print(f"  {label} Not pre-allocated")
+                continue
+            prefixlen = max(set(prefixes), key=prefixes.count)
+            start = index.allocate(prefixlen)
+            if start is None:
+                print(f"  {label} No free /{prefixlen} left in the environment block")
+            else:
+                print(f"  {label} {format_cidr(index.version, start, prefixlen)} (free, "
+                      f"{1 << (ADDRESS_BITS[index.version] - prefixlen):,} IPs)")
 
+        if next_cluster_name not in cluster_ranges:
+            print(f"\nReserve these with: ip-allocation-checker.py allocate {env} {next_cluster_name} "
+                  f"<prefixlen> --kind pods|services")
 
 def main():
     """Main entry point."""
-    checker = IPAllocationChecker()
+    cache_file = None
+    if len(sys.argv) > 2 and sys.argv[1] == '--cache':
+        cache_file = sys.argv[2]
+        del sys.argv[1:3]
+    checker = IPAllocationChecker(cache_file=cache_file)
 
     if len(sys.argv) < 2:
         command = "validate"
@@ -298,7 +1209,8 @@ def main():
         command = sys.argv[1]
 
     if command == "validate":
-        checker.validate()
+        if not checker.validate():
+            sys.exit(1)
     elif command == "visualize":
         checker.visualize()
     elif command == "available":
@@ -306,6 +1218,71 @@ def main():
     elif command == "next":
         env = sys.argv[2] if len(sys.argv) > 2 else 'dp-dev-01'
         checker.suggest_next_cluster(env)
+    elif command == "allocate":
+        parser = argparse.ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} allocate",
+                                         description='Reserve the best-fit free range in an environment block')
+        parser.add_argument('env', help='Environment name, e.g. dp-dev-01')
+        parser.add_argument('name', help='Subnet name, or cluster name (cluster-03) for pods/services')
+        parser.add_argument('prefixlen', type=lambda v: int(v.lstrip('/')), help='Prefix length, e.g. 20 or /20')
+        parser.add_argument('--kind', choices=['primary', 'pods', 'services'], default='primary',
+                            help='Primary subnet or GKE secondary range (default: primary)')
+        parser.add_argument('--description', default='', help='Description stored with the allocation')
+        parser.add_argument('--dry-run', action='store_true', help='Show the range without writing the file')
+        args = parser.parse_args(sys.argv[2:])
+
+        try:
+            cidr = checker.allocate(args.env, args.name, args.prefixlen, args.kind, args.description, args.dry_run)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        verb = "Would allocate" if args.dry_run else "Allocated"
+        print(f"✅ {verb} {cidr} for {args.env}/{args.name} ({args.kind})")
+        if not args.dry_run:
+            print(f"   Written to {checker.allocation_path}")
+    elif command == "report":
+        parser = argparse.ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} report",
+                                         description='Capacity report for every declared block and IPv4 /16')
+        parser.add_argument('--json', action='store_true', help='Print the JSON report instead of the tables')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        args = parser.parse_args(sys.argv[2:])
+
+        report = checker.capacity_report()
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            checker.print_capacity_report(report)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport saved to: {args.output}", file=sys.stderr if args.json else sys.stdout)
+    elif command == "reconcile":
+        parser = argparse.ArgumentParser(prog=f"{os.path.basename(sys.argv[0])} reconcile",
+                                         description='Compare ip-allocation.yaml with the IPs used under live/')
+        parser.add_argument('--repo-root', default=os.path.dirname(SCRIPT_DIR), help='Repository root directory')
+        parser.add_argument('--rendered', action='store_true',
+                            help='Read usages from rendered unit configs instead of raw terragrunt.hcl text')
+        parser.add_argument('--output', help='Write the JSON result to this file')
+        args = parser.parse_args(sys.argv[2:])
+
+        ip_tracker = load_ip_tracker()
+        tracker = ip_tracker.IPAllocationTracker(args.repo_root)
+        if args.rendered:
+            try:
+                ip_tracker.load_config_renderer()
+            except RuntimeError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            tracker.scan_rendered_configs()
+        else:
+            tracker.scan_terragrunt_files()
+        result = checker.reconcile(tracker.allocations)
+        checker.print_reconciliation(result)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=2)
+            print(f"\nReport saved to: {args.output}")
+        if result['undeclared_usages'] or result['outside_env_block']:
+            sys.exit(1)
     else:
         print(__doc__)
         sys.exit(1)
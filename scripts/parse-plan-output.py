@@ -2,156 +2,1158 @@
 """
 Parse Terraform/OpenTofu plan output and convert to structured JSON
 Removes ANSI colors and timestamps, extracts resource changes
+
+Input is consumed line by line, so memory stays flat on very large plans.
+Each resource block is parsed into before/after trees, including nested
+maps, lists, blocks and heredocs; `attributes` holds the new values for
+creates, the old ones for destroys and changed keys for updates.
+With --ndjson each resource is written as soon as its block closes, which
+allows piping `tofu plan` straight into the parser.
+
+`tofu show -json` plans are detected automatically (or with --format json)
+and their resource_changes are streamed into the same output schema, with
+exact before/after values. Install `ijson` for the fastest JSON path; the
+stdlib fallback also decodes one resource change at a time.
+
+--only destructive and --types (fnmatch patterns, or `sensitive`) gate a
+plan: non-matching blocks are skipped without parsing their attributes and
+the output is a compact risk summary listing matching resource addresses.
+
+--cache stores the parsed result next to the plan file, keyed by the
+plan's content hash and PARSER_VERSION, so workflow retries and repeated
+summary steps reuse it. load_plan() and iter_plan_resources() expose the
+same cache to Python callers.
+
+Every record carries its full resource address (module path and for_each
+key included). --diff BASE_PLAN indexes both plans by address and reports
+resources added, removed or changed between them in linear time, e.g. a
+PR's plan before and after a rebase.
+
+--aggregate parses a directory or glob of per-unit plan logs in a process
+pool and reports per-unit and total summaries keyed by unit path.
 """
 
 import re
+import io
+import os
+import glob
 import json
 import sys
-from typing import Dict, List, Any
+import codecs
+import fnmatch
+import hashlib
+import argparse
+import functools
+import multiprocessing
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple
 from datetime import datetime, timezone
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Bump whenever the record schema changes so cached results are re-parsed
+PARSER_VERSION = "4"
+CACHE_SUFFIX = ".parsed.ndjson"
+# Placeholder tofu itself prints for sensitive values in text plans
+SENSITIVE_MASK = "(sensitive value)"
+
+# Patterns used on every line are compiled once at import time
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+TIMESTAMP_PREFIX = re.compile(r'\d{2}:\d{2}:\d{2}\.\d{3} STDOUT tofu:\s*')
+DATA_READ_COMPLETE = re.compile(r'data\.([^:]+):\s*Read complete')
+JSON_RESOURCE_CHANGES_KEY = re.compile(r'"resource_changes"\s*:\s*\[')
+
 def strip_ansi_colors(text: str) -> str:
     """Remove ANSI color codes from text"""
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    return ansi_escape.sub('', text)
-
-def parse_resource_change(lines: List[str], start_idx: int) -> Dict[str, Any]:
-    """Parse a single resource change block"""
-    resource_info = {
-        "action": None,
-        "resource_type": None,
-        "resource_name": None,
+    if '\x1b' not in text:
+        return text
+    return ANSI_ESCAPE.sub('', text)
+
+# Action markers as they appear in front of a block header
+ACTION_MARKERS = {
+    "+": "create",
+    "~": "update",
+    "-": "destroy",
+    "-/+": "replace",
+    "+/-": "replace",
+    "<=": "read",
+}
+
+# Matches block headers such as:  -/+ resource "google_sql_database_instance" "db" {
+HEADER_PATTERN = re.compile(r'(-/\+|\+/-|<=|\+|~|-) (resource|data) "([^"]+)" "([^"]+)" \{$')
+
+# First characters a header can start with; anything else skips the regex
+HEADER_FIRST_CHARS = frozenset("+~-<")
+ATTRIBUTE_MARKERS = ("+ ", "~ ", "- ")
+
+# Which trees (before, after) a line or block lands in, by change marker
+MARKER_SIDES = {
+    "": (True, True),
+    "~": (True, True),
+    "-/+": (True, True),
+    "+/-": (True, True),
+    "+": (False, True),
+    "-": (True, False),
+}
+ACTION_SIDES = {
+    "create": (False, True),
+    "read": (False, True),
+    "destroy": (True, False),
+    "update": (True, True),
+    "replace": (True, True),
+}
+OPENERS = {"{": "object", "[": "list", "(": "call"}
+SCALAR_LITERALS = {
+    "(known after apply)": None,
+    "null": None,
+    "true": True,
+    "false": False,
+    "{}": {},
+    "[]": [],
+}
+QUOTED_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+HIDDEN_MARKER = re.compile(r'# \((\d+) unchanged (attribute|block|element)s? hidden\)')
+HEREDOC_START = re.compile(r'<<-?([A-Za-z_]\w*)$')
+# `# module.x.google_y.z["key"] will be updated in-place` precedes each header
+ADDRESS_COMMENT = re.compile(r'# (.+?) (?:will be|must be|is tainted|has moved)\b')
+
+# Actions and resource types that matter when gating a plan (see --only / --types)
+DESTRUCTIVE_ACTIONS = frozenset(("destroy", "replace"))
+SENSITIVE_TYPES = (
+    "google_sql_database_instance",
+    "google_container_cluster",
+    "google_kms_*",
+    "google_project",
+)
+
+def empty_summary() -> Dict[str, int]:
+    """Return a zeroed action summary"""
+    return {
+        "to_create": 0,
+        "to_update": 0,
+        "to_destroy": 0,
+        "to_replace": 0,
+        "to_read": 0
+    }
+
+def clean_line(line: str) -> str:
+    """Strip ANSI colors, the tofu timestamp prefix and surrounding whitespace from one line"""
+    if '\x1b' in line:
+        line = ANSI_ESCAPE.sub('', line)
+    line = line.strip()
+    # Only lines starting with a digit can carry the timestamp prefix
+    if line[:1].isdigit():
+        timestamp_match = TIMESTAMP_PREFIX.match(line)
+        if timestamp_match:
+            line = line[timestamp_match.end():]
+    return line
+
+def parse_resource_header(line: str) -> Optional[Dict[str, Any]]:
+    """Parse a block header line into an empty resource record, or None if it is not a header"""
+    header_match = HEADER_PATTERN.match(line)
+    if not header_match:
+        return None
+    marker, mode, resource_type, resource_name = header_match.groups()
+    return {
+        "action": ACTION_MARKERS[marker],
+        "mode": "managed" if mode == "resource" else "data",
+        "resource_type": resource_type,
+        "resource_name": resource_name,
+        "address": None,
+        "attributes": {}
+    }
+
+def resource_address(resource: Dict[str, Any]) -> str:
+    """Fallback address when the plan did not print one: `[data.]type.name`"""
+    prefix = "data." if resource["mode"] == "data" else ""
+    return f"{prefix}{resource['resource_type']}.{resource['resource_name']}"
+
+def split_marker(line: str) -> Tuple[str, str]:
+    """Split a block body line into its change marker ('' when unchanged) and the rest"""
+    if line[:4] in ("-/+ ", "+/- "):
+        return line[:3], line[4:].lstrip()
+    if line[:2] in ATTRIBUTE_MARKERS:
+        return line[0], line[2:].lstrip()
+    return "", line
+
+def find_unquoted(text: str, token: str) -> int:
+    """Index of token in text outside double-quoted strings, or -1"""
+    pos = 0
+    while True:
+        index = text.find(token, pos)
+        if index < 0:
+            return -1
+        quote = text.find('"', pos, index)
+        if quote < 0:
+            return index
+        string_match = QUOTED_STRING.match(text, quote)
+        if not string_match:
+            return -1
+        pos = string_match.end()
+
+def split_transition(value: str) -> Tuple[str, Optional[str]]:
+    """Split `old -> new # comment` into (old, new); new is None when there is no arrow"""
+    comment = find_unquoted(value, " # ")
+    if comment >= 0:
+        value = value[:comment].rstrip()
+    arrow = find_unquoted(value, " -> ")
+    if arrow < 0:
+        return value, None
+    return value[:arrow].rstrip(), value[arrow + 4:].lstrip()
+
+def heredoc_end(line: str, terminator: str) -> Optional[str]:
+    """
+    What follows a heredoc's closing terminator on its line ('' for a bare
+    `EOT`, '-> null' for a destroyed `EOT -> null`), or None if the line
+    does not close the heredoc
+    """
+    if line == terminator:
+        return ""
+    if line.startswith(terminator + " "):
+        return line[len(terminator) + 1:].lstrip()
+    return None
+
+def parse_scalar(value: str) -> Any:
+    """Convert one rendered plan value to Python (unknown values become None)"""
+    if value.startswith('"'):
+        if '\\' not in value and value.endswith('"') and len(value) > 1:
+            return value[1:-1]
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value.strip('"')
+    if value in SCALAR_LITERALS:
+        literal = SCALAR_LITERALS[value]
+        return type(literal)() if isinstance(literal, (dict, list)) else literal
+    if value.lstrip('-').isdigit():
+        return int(value)
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def diff_attributes(action: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Top-level attributes of a change: the new values, the old ones for destroys, or changed keys only"""
+    before = before or {}
+    after = after or {}
+    if action == "destroy":
+        return dict(before)
+    if action in ("create", "read"):
+        return dict(after)
+    return {
+        key: {"before": before.get(key), "after": after.get(key)}
+        for key in {**before, **after}
+        if before.get(key) != after.get(key)
+    }
+
+class _Frame:
+    """One open `{`, `[`, `(` or heredoc inside a resource block"""
+    __slots__ = ("kind", "key", "sides", "block", "before", "after", "lines", "terminator")
+
+    def __init__(self, kind: str, key: Any, sides: Tuple[bool, bool], block: bool = False):
+        self.kind = kind
+        self.key = key
+        self.sides = sides
+        self.block = block
+        empty = dict if kind == "object" else list
+        self.before = empty() if sides[0] else None
+        self.after = empty() if sides[1] else None
+        self.lines = None
+        self.terminator = None
+
+class AttributeTreeParser:
+    """
+    Incremental parser for the attribute body of one resource block.
+
+    Fed one cleaned line at a time, it keeps a stack of open maps, lists,
+    nested blocks, `jsonencode(...)` calls and heredocs and builds separate
+    before and after trees. A line's marker decides which trees it lands in:
+    `+` only after, `-` only before, `~` and unmarked lines both, with
+    `old -> new` splitting the value. Nested blocks are stored as lists of
+    objects, as in `tofu show -json`. `# (N unchanged ... hidden)` markers
+    are counted in `hidden`.
+    """
+
+    def __init__(self, action: str):
+        self.action = action
+        self.hidden = {"attributes": 0, "blocks": 0, "elements": 0}
+        self._root = _Frame("object", None, ACTION_SIDES[action])
+        self._stack = [self._root]
+
+    def feed(self, line: str) -> bool:
+        """Consume one body line; returns True once the resource block itself closes"""
+        frame = self._stack[-1]
+        if frame.kind == "heredoc":
+            rest = heredoc_end(line, frame.terminator)
+            if rest is None:
+                frame.lines.append(line)
+                return False
+            self._stack.pop()
+            text = "\n".join(frame.lines)
+            _, new = split_transition("x " + rest)
+            self._store(self._stack[-1], frame.key, text, text if new is None else parse_scalar(new), frame.sides)
+            return False
+
+        if not line:
+            return False
+        first = line[0]
+        if first in "}])":
+            return self._close(line[1:].lstrip(" ,"))
+        if first == "#":
+            hidden_match = HIDDEN_MARKER.match(line)
+            if hidden_match:
+                self.hidden[hidden_match.group(2) + "s"] += int(hidden_match.group(1))
+            return False
+
+        marker, rest = split_marker(line)
+        sides = MARKER_SIDES[marker]
+        if frame.kind != "object":
+            key, value = None, rest.rstrip(",")
+        else:
+            equals = find_unquoted(rest, " = ")
+            if equals < 0:
+                # Nested block: `name {`
+                if rest.endswith(" {"):
+                    self._open("object", rest[:-2].rstrip(), sides, block=True)
+                return False
+            key, value = rest[:equals].rstrip(), rest[equals + 3:].lstrip()
+            if key.startswith('"'):
+                key = parse_scalar(key)
+
+        if value.startswith("<<"):
+            heredoc = self._open("heredoc", key, sides)
+            heredoc.lines = []
+            heredoc.terminator = value.lstrip("<-").strip()
+        elif value[-1:] in OPENERS:
+            self._open(OPENERS[value[-1]], key, sides)
+        else:
+            old, new = split_transition(value)
+            old_value = parse_scalar(old)
+            self._store(frame, key, old_value, old_value if new is None else parse_scalar(new), sides)
+        return False
+
+    def _open(self, kind: str, key: Any, sides: Tuple[bool, bool], block: bool = False) -> _Frame:
+        parent = self._stack[-1]
+        sides = (sides[0] and parent.before is not None, sides[1] and parent.after is not None)
+        frame = _Frame(kind, key, sides, block)
+        self._stack.append(frame)
+        return frame
+
+    def _close(self, rest: str) -> bool:
+        frame = self._stack.pop()
+        if not self._stack:
+            return True
+        before, after = frame.before, frame.after
+        if frame.kind == "call":
+            before = before[0] if before else None
+            after = after[0] if after else None
+        if rest.startswith("->"):
+            after = parse_scalar(split_transition("x " + rest)[1])
+        parent = self._stack[-1]
+        if frame.block:
+            for tree, value, present in ((parent.before, before, frame.sides[0]),
+                                         (parent.after, after, frame.sides[1])):
+                if present and tree is not None:
+                    tree.setdefault(frame.key, []).append(value)
+        else:
+            self._store(parent, frame.key, before, after, frame.sides)
+        return False
+
+    @staticmethod
+    def _store(frame: _Frame, key: Any, before: Any, after: Any, sides: Tuple[bool, bool]):
+        if sides[0] and frame.before is not None:
+            if frame.kind == "object":
+                frame.before[key] = before
+            else:
+                frame.before.append(before)
+        if sides[1] and frame.after is not None:
+            if frame.kind == "object":
+                frame.after[key] = after
+            else:
+                frame.after.append(after)
+
+    def result(self) -> Dict[str, Any]:
+        """Return before/after trees, top-level changed attributes and hidden counts"""
+        # Fold frames left open by truncated input into their parents
+        while len(self._stack) > 1:
+            self._close("")
+        before, after = self._root.before, self._root.after
+        return {
+            "attributes": diff_attributes(self.action, before, after),
+            "before": before,
+            "after": after,
+            "hidden": self.hidden,
+        }
+
+class BlockSkipper:
+    """Finds the end of a resource block by bracket depth without parsing its attributes"""
+
+    def __init__(self):
+        self._depth = 1
+        self._heredoc = None
+
+    def feed(self, line: str) -> bool:
+        """Consume one body line; returns True once the resource block closes"""
+        if self._heredoc is not None:
+            if heredoc_end(line, self._heredoc) is not None:
+                self._heredoc = None
+            return False
+        if line[:1] in ("}", "]", ")"):
+            self._depth -= 1
+            return self._depth == 0
+        if line.endswith(("{", "[", "(")):
+            self._depth += 1
+        elif "<<" in line:
+            heredoc_match = HEREDOC_START.search(line)
+            if heredoc_match:
+                self._heredoc = heredoc_match.group(1)
+        return False
+
+    def result(self) -> Dict[str, Any]:
+        return {}
+
+class PlanStreamParser:
+    """
+    Incremental, single-pass plan parser.
+
+    A header (`+`, `~`, `-`, `-/+`, `+/-` or `<=` followed by
+    `resource`/`data`) is only recognised outside a block. Body lines go to
+    an AttributeTreeParser as they arrive, and the block ends when its
+    closing brace pops the parser's stack, so every line is visited exactly
+    once and only the open record is held in memory.
+
+    `select` (a predicate on the header record) and `attributes=False`
+    short-circuit the parse: blocks that are not selected, or all blocks
+    when attributes are off, are only scanned for their closing bracket.
+    Every block is still counted in the summary, but only selected blocks
+    are yielded.
+    """
+
+    def __init__(self, select: Optional[Callable[[Dict[str, Any]], bool]] = None, attributes: bool = True):
+        self.summary = empty_summary()
+        self.data_sources = []
+        self.select = select
+        self.attributes = attributes
+        self._resource = None
+        self._tree = None
+        self._selected = False
+        self._address = None
+
+    def feed(self, line: str) -> Optional[Dict[str, Any]]:
+        """Consume one cleaned line, returning a resource record if a block closed"""
+        if self._resource is None:
+            if line[:1] in HEADER_FIRST_CHARS and line.endswith("{"):
+                resource = parse_resource_header(line)
+                if resource:
+                    resource["address"] = self._address or resource_address(resource)
+                    self._address = None
+                    self._resource = resource
+                    self._selected = self.select is None or self.select(resource)
+                    if self._selected and self.attributes:
+                        self._tree = AttributeTreeParser(resource["action"])
+                    else:
+                        self._tree = BlockSkipper()
+                    return None
+            elif line[:2] == "# ":
+                address_match = ADDRESS_COMMENT.match(line)
+                if address_match:
+                    self._address = address_match.group(1)
+                return None
+
+            # Parse data source reads
+            if "Read complete" in line and "data." in line:
+                data_match = DATA_READ_COMPLETE.search(line)
+                if data_match:
+                    self.data_sources.append({
+                        "name": data_match.group(1),
+                        "status": "read_complete"
+                    })
+            return None
+
+        if self._tree.feed(line):
+            resource = self._close_block()
+            return resource if self._selected else None
+        return None
+
+    def parse(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Yield resource records from raw plan lines as each block closes"""
+        for raw_line in lines:
+            resource = self.feed(clean_line(raw_line))
+            if resource:
+                yield resource
+        resource = self.finish()
+        if resource:
+            yield resource
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """Flush a block left open at end of input"""
+        if self._resource is None:
+            return None
+        resource = self._close_block()
+        return resource if self._selected else None
+
+    def _close_block(self) -> Dict[str, Any]:
+        resource, self._resource = self._resource, None
+        resource.update(self._tree.result())
+        self._tree = None
+        self.summary[f"to_{resource['action']}"] += 1
+        return resource
+
+# `tofu show -json` change actions mapped to the text parser's action names
+JSON_ACTIONS = {
+    ("create",): "create",
+    ("update",): "update",
+    ("delete",): "destroy",
+    ("delete", "create"): "replace",
+    ("create", "delete"): "replace",
+    ("read",): "read",
+}
+
+JSON_CHUNK_SIZE = 1 << 20
+
+def iter_json_resource_changes(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the entries of a JSON plan's top-level `resource_changes` array one
+    at a time. Uses ijson when it is installed; otherwise locates the array
+    and decodes one element at a time with the stdlib decoder, so only the
+    current element is held in memory.
+    """
+    if ijson is not None:
+        yield from ijson.items(stream, 'resource_changes.item', use_float=True)
+        return
+
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    eof = False
+
+    def read_more(size: int) -> bool:
+        nonlocal buffer, eof
+        chunk = stream.read(size)
+        if not chunk:
+            eof = True
+            buffer += text_decoder.decode(b'', final=True)
+            return False
+        buffer += text_decoder.decode(chunk)
+        return True
+
+    # Skip everything before the array (planned_values can be very large)
+    while True:
+        key_match = JSON_RESOURCE_CHANGES_KEY.search(buffer)
+        if key_match:
+            buffer = buffer[key_match.end():]
+            break
+        # Keep a tail in case the key straddles two chunks
+        buffer = buffer[-64:]
+        if not read_more(JSON_CHUNK_SIZE):
+            return
+
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buffer):
+            buffer, pos = '', 0
+            if not read_more(JSON_CHUNK_SIZE):
+                raise ValueError("Unexpected end of JSON plan inside resource_changes")
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            change, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Element not fully buffered yet; grow geometrically to stay linear
+            if eof or not read_more(max(JSON_CHUNK_SIZE, len(buffer))):
+                raise
+            continue
+        yield change
+        buffer, pos = buffer[end:], 0
+
+def json_change_header(change: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Resource record without attributes for one `resource_changes` entry (None for no-ops)"""
+    action = JSON_ACTIONS.get(tuple((change.get("change") or {}).get("actions") or ()))
+    if action is None:
+        return None
+    resource = {
+        "action": action,
+        "mode": change.get("mode", "managed"),
+        "resource_type": change.get("type"),
+        "resource_name": change.get("name"),
+        "address": None,
         "attributes": {}
     }
+    resource["address"] = change.get("address") or resource_address(resource)
+    return resource
+
+def merge_sensitive(before_flags: Any, after_flags: Any) -> Any:
+    """Union of two `*_sensitive` trees: a value is sensitive if either side flags it"""
+    if before_flags is True or after_flags is True:
+        return True
+    if isinstance(before_flags, dict) and isinstance(after_flags, dict):
+        return {key: merge_sensitive(before_flags.get(key), after_flags.get(key))
+                for key in {**before_flags, **after_flags}}
+    if isinstance(before_flags, list) and isinstance(after_flags, list):
+        length = max(len(before_flags), len(after_flags))
+        return [merge_sensitive(before_flags[i] if i < len(before_flags) else None,
+                                after_flags[i] if i < len(after_flags) else None) for i in range(length)]
+    return before_flags or after_flags
+
+def mask_sensitive(value: Any, flags: Any) -> Any:
+    """Copy of `value` with every subtree flagged in the `*_sensitive` tree replaced by SENSITIVE_MASK"""
+    if flags is True:
+        return None if value is None else SENSITIVE_MASK
+    if isinstance(flags, dict) and isinstance(value, dict):
+        return {key: mask_sensitive(item, flags.get(key)) for key, item in value.items()}
+    if isinstance(flags, list) and isinstance(value, list):
+        return [mask_sensitive(item, flags[i] if i < len(flags) else None) for i, item in enumerate(value)]
+    return value
+
+def json_change_to_record(change: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Convert one `resource_changes` entry to the resource record schema (None for no-ops)"""
+    resource = json_change_header(change)
+    if resource is None:
+        return None
+    action = resource["action"]
+    details = change["change"]
+
+    before = details.get("before") or {}
+    after = details.get("after") or {}
+    unknown = details.get("after_unknown") or {}
+    sensitive = merge_sensitive(details.get("before_sensitive") or {}, details.get("after_sensitive") or {})
+    masked_before = mask_sensitive(before, sensitive)
+    masked_after = mask_sensitive(after, sensitive)
+
+    def after_value(key):
+        if unknown.get(key) is True:
+            return None
+        return masked_after.get(key)
+
+    if action == "destroy":
+        attributes = dict(masked_before)
+    elif action in ("create", "read"):
+        attributes = {key: after_value(key) for key in {**after, **unknown}}
+    else:
+        # Compare the raw values so a changed secret still shows up (masked) in the diff
+        attributes = {}
+        for key in {**before, **after, **unknown}:
+            if unknown.get(key) is True or before.get(key) != after.get(key):
+                attributes[key] = {"before": masked_before.get(key), "after": after_value(key)}
 
-    # Parse the resource header line
-    header_line = lines[start_idx].strip()
-
-    # Extract action (+ create, ~ update, - destroy, etc.)
-    if header_line.startswith("+ "):
-        resource_info["action"] = "create"
-        header_line = header_line[2:]
-    elif header_line.startswith("~ "):
-        resource_info["action"] = "update"
-        header_line = header_line[2:]
-    elif header_line.startswith("- "):
-        resource_info["action"] = "destroy"
-        header_line = header_line[2:]
-    elif header_line.startswith("-/+ "):
-        resource_info["action"] = "replace"
-        header_line = header_line[4:]
-
-    # Extract resource type and name
-    resource_match = re.match(r'resource "([^"]+)" "([^"]+)"', header_line)
-    if resource_match:
-        resource_info["resource_type"] = resource_match.group(1)
-        resource_info["resource_name"] = resource_match.group(2)
-
-    # Parse attributes
-    i = start_idx + 1
-    while i < len(lines) and not lines[i].strip().startswith("+ resource "):
-        line = lines[i].strip()
-        if line.startswith("+ ") or line.startswith("~ ") or line.startswith("- "):
-            # Parse attribute line
-            attr_line = line[2:].strip()
-            if " = " in attr_line:
-                key, value = attr_line.split(" = ", 1)
-                key = key.strip()
-                value = value.strip()
-
-                # Clean up value formatting
-                if value == "(known after apply)":
-                    value = None
-                elif value.startswith('"') and value.endswith('"'):
-                    value = value[1:-1]  # Remove quotes
-                elif value == "true":
-                    value = True
-                elif value == "false":
-                    value = False
-                elif value.isdigit():
-                    value = int(value)
-                elif value.startswith("{") or value.startswith("["):
-                    # Handle complex structures - keep as string for now
-                    pass
-
-                resource_info["attributes"][key] = value
-        i += 1
-
-    return resource_info
+    resource["attributes"] = attributes
+    resource["before"] = mask_sensitive(details.get("before"), sensitive)
+    resource["after"] = mask_sensitive(details.get("after"), sensitive)
+    return resource
+
+class JsonPlanParser:
+    """Parser for `tofu show -json` plans with the same summary/record output as PlanStreamParser"""
+
+    def __init__(self, select: Optional[Callable[[Dict[str, Any]], bool]] = None, attributes: bool = True):
+        self.summary = empty_summary()
+        self.data_sources = []
+        self.select = select
+        self.attributes = attributes
+
+    def parse(self, stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+        """Yield resource records from a binary JSON plan stream"""
+        for change in iter_json_resource_changes(stream):
+            resource = json_change_header(change)
+            if resource is None:
+                continue
+            self.summary[f"to_{resource['action']}"] += 1
+            if self.select is not None and not self.select(resource):
+                continue
+            yield json_change_to_record(change) if self.attributes else resource
+
+def detect_plan_format(stream: BinaryIO) -> str:
+    """Return 'json' if the buffered stream starts with a JSON object, else 'text'"""
+    head = stream.peek(64)[:64] if hasattr(stream, 'peek') else b''
+    return 'json' if head.lstrip().startswith(b'{') else 'text'
+
+def open_plan_parser(stream: BinaryIO, plan_format: str = 'auto',
+                     select: Optional[Callable[[Dict[str, Any]], bool]] = None, attributes: bool = True):
+    """Return (parser, resource iterator) for a binary plan stream"""
+    if plan_format == 'auto':
+        plan_format = detect_plan_format(stream)
+    if plan_format == 'json':
+        parser = JsonPlanParser(select, attributes)
+        return parser, parser.parse(stream)
+    parser = PlanStreamParser(select, attributes)
+    return parser, parser.parse(io.TextIOWrapper(stream, encoding='utf-8', errors='replace'))
+
+def build_plan_data(parser, resources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Assemble the JSON document emitted by default"""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "summary": parser.summary,
+        "resources": resources,
+        "data_sources": parser.data_sources,
+        "outputs": {}
+    }
+
+def parse_plan_stream(stream: BinaryIO, plan_format: str = 'auto') -> Dict[str, Any]:
+    """Parse a binary text or JSON plan stream into the JSON document"""
+    parser, resources = open_plan_parser(stream, plan_format)
+    return build_plan_data(parser, list(resources))
+
+def parse_plan_lines(lines: Iterable[str]) -> Dict[str, Any]:
+    """Parse text plan output from any iterable of lines (file object, stdin, list)"""
+    parser = PlanStreamParser()
+    return build_plan_data(parser, list(parser.parse(lines)))
 
 def parse_plan_output(raw_output: str) -> Dict[str, Any]:
-    """Parse the complete plan output"""
-    # Strip ANSI colors and split into lines
-    clean_output = strip_ansi_colors(raw_output)
-    lines = clean_output.split('\n')
+    """Parse the complete plan output (human-readable text or `tofu show -json`)"""
+    if raw_output.lstrip().startswith('{'):
+        return parse_plan_stream(io.BytesIO(raw_output.encode('utf-8')), 'json')
+    return parse_plan_lines(raw_output.split('\n'))
+
+def make_resource_filter(only: Optional[str] = None,
+                         types: Optional[List[str]] = None) -> Optional[Callable[[Dict[str, Any]], bool]]:
+    """
+    Build a header predicate for --only / --types, or None when nothing is filtered.
+
+    Types are exact names or fnmatch patterns; `sensitive` expands to
+    SENSITIVE_TYPES. Type decisions are memoised since plans repeat types.
+    """
+    if not only and not types:
+        return None
+    actions = DESTRUCTIVE_ACTIONS if only == "destructive" else None
+    patterns = []
+    for entry in types or []:
+        for name in entry.split(','):
+            name = name.strip()
+            if name == "sensitive":
+                patterns.extend(SENSITIVE_TYPES)
+            elif name:
+                patterns.append(name)
+    type_matches = {}
+
+    def select(resource: Dict[str, Any]) -> bool:
+        if actions is not None and resource["action"] not in actions:
+            return False
+        if not patterns:
+            return True
+        resource_type = resource["resource_type"]
+        matched = type_matches.get(resource_type)
+        if matched is None:
+            matched = any(fnmatch.fnmatchcase(resource_type, pattern) for pattern in patterns)
+            type_matches[resource_type] = matched
+        return matched
+
+    return select
+
+def scan_plan_risks(stream: BinaryIO, plan_format: str = 'auto', only: Optional[str] = None,
+                    types: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Compact risk summary for plan gating: the addresses of the changes that
+    pass the --only / --types filter, plus the plan's full action summary.
+    Attributes are never parsed, so this only costs a scan for block ends.
+    """
+    parser, resources = open_plan_parser(stream, plan_format, make_resource_filter(only, types), attributes=False)
+    return build_risk_report(parser, resources, only, types)
+
+def build_risk_report(parser, resources: Iterable[Dict[str, Any]], only: Optional[str] = None,
+                      types: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Assemble the risk summary from already filtered resources"""
+    matched = empty_summary()
+    risks = []
+    for resource in resources:
+        matched[f"to_{resource['action']}"] += 1
+        risks.append({
+            "address": resource["address"],
+            "action": resource["action"],
+            "resource_type": resource["resource_type"]
+        })
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "filter": {"only": only, "types": types or []},
+        "summary": parser.summary,
+        "matched": matched,
+        "risks": risks
+    }
+
+def index_resources(resources: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Index records by full resource address (`module.x.google_y.z["key"]`).
+
+    Entries keep the action, type and top-level attributes but drop the
+    before/after trees. If an address repeats (e.g. a drift report ahead of
+    the planned change), the later record wins.
+    """
+    index = {}
+    for resource in resources:
+        index[resource["address"]] = {
+            "action": resource["action"],
+            "resource_type": resource["resource_type"],
+            "attributes": resource["attributes"]
+        }
+    return index
+
+def diff_plans(base_resources: Iterable[Dict[str, Any]], resources: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Compare two plans by resource address in linear time.
+
+    Reports addresses only in the new plan (added), only in the base plan
+    (removed), and present in both with a different action or different
+    planned attributes (changed, with the differing top-level keys).
+    Lists follow plan order.
+    """
+    base = index_resources(base_resources)
+    current = index_resources(resources)
+    added, changed = [], []
+    unchanged = 0
+    for address, entry in current.items():
+        old = base.pop(address, None)
+        if old is None:
+            added.append({"address": address, "action": entry["action"]})
+            continue
+        if old["action"] == entry["action"] and old["attributes"] == entry["attributes"]:
+            unchanged += 1
+            continue
+        old_attributes, new_attributes = old["attributes"], entry["attributes"]
+        changed.append({
+            "address": address,
+            "before_action": old["action"],
+            "after_action": entry["action"],
+            "attributes": [
+                key for key in {**old_attributes, **new_attributes}
+                if old_attributes.get(key) != new_attributes.get(key)
+            ]
+        })
+    removed = [{"address": address, "action": entry["action"]} for address, entry in base.items()]
 
-    plan_data = {
+    return {
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "summary": {
-            "to_create": 0,
-            "to_update": 0,
-            "to_destroy": 0,
-            "to_replace": 0
+            "added": len(added),
+            "removed": len(removed),
+            "changed": len(changed),
+            "unchanged": unchanged
         },
-        "resources": [],
-        "data_sources": [],
-        "outputs": {}
+        "added": added,
+        "removed": removed,
+        "changed": changed
     }
 
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-
-        # Remove timestamp prefix if present
-        if re.match(r'^\d{2}:\d{2}:\d{2}\.\d{3} STDOUT tofu:', line):
-            line = re.sub(r'^\d{2}:\d{2}:\d{2}\.\d{3} STDOUT tofu:\s*', '', line)
-
-        # Parse resource changes
-        if ("+ resource " in line or "~ resource " in line or
-            "- resource " in line or "-/+ resource " in line):
-            resource = parse_resource_change(lines, i)
-            if resource["resource_type"]:  # Only add if we successfully parsed it
-                plan_data["resources"].append(resource)
-
-            # Update summary
-            action = resource["action"]
-            if action == "create":
-                plan_data["summary"]["to_create"] += 1
-            elif action == "update":
-                plan_data["summary"]["to_update"] += 1
-            elif action == "destroy":
-                plan_data["summary"]["to_destroy"] += 1
-            elif action == "replace":
-                plan_data["summary"]["to_replace"] += 1
-
-        # Parse data source reads
-        elif "data." in line and "Read complete" in line:
-            data_match = re.search(r'data\.([^:]+):\s*Read complete', line)
-            if data_match:
-                plan_data["data_sources"].append({
-                    "name": data_match.group(1),
-                    "status": "read_complete"
-                })
-
-        i += 1
-
-    return plan_data
+def stream_plan_ndjson(stream: BinaryIO, plan_format: str = 'auto', out=sys.stdout,
+                       select: Optional[Callable[[Dict[str, Any]], bool]] = None, attributes: bool = True):
+    """Write one JSON object per resource as soon as it is parsed, then the summary"""
+    write_plan_ndjson(*open_plan_parser(stream, plan_format, select, attributes), out=out)
+
+def write_plan_ndjson(parser, resources: Iterable[Dict[str, Any]], out=sys.stdout):
+    """Write resources as NDJSON while they are produced, then data sources and the summary"""
+    for resource in resources:
+        out.write(json.dumps({"kind": "resource", **resource}, ensure_ascii=False) + "\n")
+        out.flush()
+
+    for data_source in parser.data_sources:
+        out.write(json.dumps({"kind": "data_source", **data_source}, ensure_ascii=False) + "\n")
+    out.write(json.dumps({
+        "kind": "summary",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "summary": parser.summary
+    }) + "\n")
+    out.flush()
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(JSON_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CachedPlanParser:
+    """
+    Plan parser backed by a cache file next to the plan log.
+
+    The cache (`<plan>.parsed.ndjson`) starts with a key line holding the
+    parser version, the plan's content hash and the requested format,
+    followed by the same resource, data_source and summary lines that
+    --ndjson writes. A matching cache is replayed line by line; otherwise
+    the plan is parsed and the cache is written alongside, and it is
+    committed only once the whole plan has been consumed. Exposes the same
+    summary / data_sources attributes as the other parsers once parse()
+    is exhausted.
+    """
+
+    def __init__(self, plan_path: str, plan_format: str = 'auto'):
+        self.plan_path = plan_path
+        self.plan_format = plan_format
+        self.cache_path = plan_path + CACHE_SUFFIX
+        self.summary = empty_summary()
+        self.data_sources = []
+        self.cached = False
+        self.key = {
+            "kind": "cache",
+            "parser_version": PARSER_VERSION,
+            "sha256": file_sha256(plan_path),
+            "format": plan_format
+        }
+
+    def parse(self) -> Iterator[Dict[str, Any]]:
+        """Lazily yield resource records, from the cache when it is valid"""
+        cache_file = self._open_cache()
+        if cache_file is not None:
+            self.cached = True
+            with cache_file:
+                yield from self._replay(cache_file)
+            return
+        yield from self._parse_and_store()
+
+    def _open_cache(self):
+        try:
+            cache_file = open(self.cache_path, 'r', encoding='utf-8')
+        except OSError:
+            return None
+        try:
+            if json.loads(cache_file.readline()) == self.key:
+                return cache_file
+        except ValueError:
+            pass
+        cache_file.close()
+        return None
+
+    def _replay(self, cache_file) -> Iterator[Dict[str, Any]]:
+        for line in cache_file:
+            entry = json.loads(line)
+            kind = entry.pop("kind")
+            if kind == "resource":
+                yield entry
+            elif kind == "data_source":
+                self.data_sources.append(entry)
+            elif kind == "summary":
+                self.summary = entry["summary"]
+
+    def _parse_and_store(self) -> Iterator[Dict[str, Any]]:
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            # Owner-only: the records carry plan values even with sensitive ones masked
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            out = os.fdopen(fd, 'w', encoding='utf-8')
+        except OSError as e:
+            print(f"Warning: cannot write plan cache {self.cache_path}: {e}", file=sys.stderr)
+            out = None
+
+        complete = False
+        try:
+            with open(self.plan_path, 'rb') as stream:
+                parser, resources = open_plan_parser(stream, self.plan_format)
+                if out is not None:
+                    out.write(json.dumps(self.key) + "\n")
+                for resource in resources:
+                    if out is not None:
+                        out.write(json.dumps({"kind": "resource", **resource}, ensure_ascii=False) + "\n")
+                    yield resource
+            self.summary, self.data_sources = parser.summary, parser.data_sources
+            if out is not None:
+                for data_source in self.data_sources:
+                    out.write(json.dumps({"kind": "data_source", **data_source}, ensure_ascii=False) + "\n")
+                out.write(json.dumps({"kind": "summary", "summary": self.summary}) + "\n")
+            complete = True
+        finally:
+            if out is not None:
+                out.close()
+                if complete:
+                    os.replace(tmp_path, self.cache_path)
+                else:
+                    os.remove(tmp_path)
+
+def load_plan(plan_path: str, plan_format: str = 'auto') -> Dict[str, Any]:
+    """Parsed JSON document for a plan file, served from its cache when valid"""
+    parser = CachedPlanParser(plan_path, plan_format)
+    return build_plan_data(parser, list(parser.parse()))
+
+def iter_plan_resources(plan_path: str, plan_format: str = 'auto') -> Iterator[Dict[str, Any]]:
+    """Lazily yield a plan file's resource records, served from its cache when valid"""
+    return CachedPlanParser(plan_path, plan_format).parse()
+
+def collect_plan_files(sources: List[str], pattern: str) -> List[Tuple[str, str]]:
+    """
+    Expand directories and globs into (unit, path) pairs, sorted by unit.
+
+    Directories are searched recursively for `pattern`. The unit key is the
+    log path, with its extension removed, relative to the directory, to the
+    literal prefix of a glob, or to a plain file's own directory.
+    """
+    jobs = {}
+    for source in sources:
+        if os.path.isdir(source):
+            root = source
+            paths = glob.glob(os.path.join(source, '**', pattern), recursive=True)
+        elif glob.has_magic(source):
+            # Units are keyed relative to the glob's literal leading directories
+            parts = source.split(os.sep)
+            literal = next(i for i, part in enumerate(parts) if glob.has_magic(part))
+            root = os.sep.join(parts[:literal]) or os.curdir
+            paths = glob.glob(source, recursive=True)
+        else:
+            root = os.path.dirname(source) or os.curdir
+            paths = [source]
+        for path in paths:
+            if os.path.isfile(path):
+                unit = os.path.splitext(os.path.relpath(path, root))[0]
+                jobs[unit] = path
+    return sorted(jobs.items())
+
+def parse_unit_plan(job: Tuple[str, str], plan_format: str = 'auto') -> Tuple[str, Dict[str, Any]]:
+    """Parse one unit's plan file; runs inside a worker process"""
+    unit, path = job
+    try:
+        with open(path, 'rb') as stream:
+            plan_data = parse_plan_stream(stream, plan_format)
+    except (OSError, ValueError) as e:
+        plan_data = {"summary": empty_summary(), "resources": [], "data_sources": [], "error": str(e)}
+    plan_data["file"] = path
+    return unit, plan_data
+
+def iter_unit_plans(jobs: List[Tuple[str, str]], plan_format: str = 'auto',
+                    workers: int = 0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Parse unit plans in a process pool, yielding (unit, plan_data) as each one finishes"""
+    worker = functools.partial(parse_unit_plan, plan_format=plan_format)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        yield from map(worker, jobs)
+        return
+    with multiprocessing.Pool(min(workers, len(jobs))) as pool:
+        yield from pool.imap_unordered(worker, jobs)
+
+def add_summary(total: Dict[str, int], summary: Dict[str, int]):
+    """Accumulate one action summary into a running total"""
+    for key, count in summary.items():
+        total[key] = total.get(key, 0) + count
+
+def aggregate_plans(jobs: List[Tuple[str, str]], plan_format: str = 'auto', workers: int = 0) -> Dict[str, Any]:
+    """Parse many unit plans into one report with per-unit and total summaries"""
+    total = empty_summary()
+    units = {}
+    for unit, plan_data in iter_unit_plans(jobs, plan_format, workers):
+        add_summary(total, plan_data["summary"])
+        plan_data.pop("timestamp", None)
+        plan_data.pop("outputs", None)
+        units[unit] = plan_data
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "summary": total,
+        "units": dict(sorted(units.items()))
+    }
+
+def stream_aggregate_ndjson(jobs: List[Tuple[str, str]], plan_format: str = 'auto',
+                            workers: int = 0, out=sys.stdout):
+    """Write combined NDJSON for many units: resources and a summary per unit, then the total"""
+    total = empty_summary()
+    for unit, plan_data in iter_unit_plans(jobs, plan_format, workers):
+        for resource in plan_data["resources"]:
+            out.write(json.dumps({"kind": "resource", "unit": unit, **resource}, ensure_ascii=False) + "\n")
+        for data_source in plan_data["data_sources"]:
+            out.write(json.dumps({"kind": "data_source", "unit": unit, **data_source}, ensure_ascii=False) + "\n")
+        unit_summary = {"kind": "unit_summary", "unit": unit, "file": plan_data["file"], "summary": plan_data["summary"]}
+        if "error" in plan_data:
+            unit_summary["error"] = plan_data["error"]
+        out.write(json.dumps(unit_summary) + "\n")
+        out.flush()
+        add_summary(total, plan_data["summary"])
+
+    out.write(json.dumps({
+        "kind": "summary",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "units": len(jobs),
+        "summary": total
+    }) + "\n")
+    out.flush()
 
 def main():
     """Main function to process stdin or file input"""
-    if len(sys.argv) > 1:
-        # Read from file
-        with open(sys.argv[1], 'r') as f:
-            raw_input = f.read()
-    else:
-        # Read from stdin
-        raw_input = sys.stdin.read()
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    arg_parser.add_argument('plan_file', nargs='?', help='Plan output or `tofu show -json` file (default: stdin)')
+    arg_parser.add_argument('--format', choices=['auto', 'text', 'json'], default='auto',
+                            help='Input format (default: auto-detect)')
+    arg_parser.add_argument('--ndjson', action='store_true',
+                            help='Stream one JSON object per resource as it is parsed, then a summary object')
+    arg_parser.add_argument('--aggregate', nargs='+', metavar='DIR_OR_GLOB',
+                            help='Parse many unit plan logs in parallel into one report keyed by unit')
+    arg_parser.add_argument('--pattern', default='*.plan',
+                            help='File pattern searched recursively in --aggregate directories (default: *.plan)')
+    arg_parser.add_argument('--jobs', type=int, default=0,
+                            help='Worker processes for --aggregate (default: CPU count)')
+    arg_parser.add_argument('--only', choices=['destructive'],
+                            help='Only report destroys and replaces, as a compact risk summary')
+    arg_parser.add_argument('--types', nargs='+', metavar='TYPE',
+                            help='Only report these resource types (fnmatch patterns, comma lists, '
+                                 '`sensitive` for SQL, GKE, KMS and projects)')
+    arg_parser.add_argument('--cache', action='store_true',
+                            help=f'Reuse or write a parsed cache next to the plan file (<plan>{CACHE_SUFFIX}), '
+                                 'keyed by content hash and parser version')
+    arg_parser.add_argument('--diff', metavar='BASE_PLAN',
+                            help='Compare against a base plan by resource address and report '
+                                 'added/removed/changed actions')
+    arg_parser.add_argument('--fail-on-match', action='store_true',
+                            help='With --only/--types, exit with status 2 if any change matches')
+    args = arg_parser.parse_args()
+    filtered = bool(args.only or args.types)
+    if filtered and args.aggregate:
+        arg_parser.error("--only/--types cannot be combined with --aggregate")
+    if args.fail_on_match and not filtered:
+        arg_parser.error("--fail-on-match requires --only or --types")
 
-    # Parse the plan output
-    parsed_data = parse_plan_output(raw_input)
+    if args.aggregate:
+        jobs = collect_plan_files(args.aggregate, args.pattern)
+        if not jobs:
+            print(f"No plan files found in: {' '.join(args.aggregate)}", file=sys.stderr)
+            sys.exit(1)
+        if args.ndjson:
+            stream_aggregate_ndjson(jobs, args.format, args.jobs)
+        else:
+            print(json.dumps(aggregate_plans(jobs, args.format, args.jobs), indent=2, ensure_ascii=False))
+        return
+
+    if args.cache and not args.plan_file:
+        arg_parser.error("--cache requires a plan file")
+    if args.diff and args.ndjson:
+        arg_parser.error("--diff cannot be combined with --ndjson")
+
+    select = make_resource_filter(args.only, args.types)
+    stream = None
+    if args.cache:
+        parser = CachedPlanParser(args.plan_file, args.format)
+        resources = parser.parse()
+        if select is not None:
+            resources = filter(select, resources)
+    else:
+        # Read from file or stdin, incrementally
+        stream = open(args.plan_file, 'rb') if args.plan_file else sys.stdin.buffer
+        # A diff compares planned attributes, so only risk reports skip them
+        parser, resources = open_plan_parser(stream, args.format, select,
+                                             attributes=not filtered or bool(args.diff))
 
-    # Output as formatted JSON
-    print(json.dumps(parsed_data, indent=2, ensure_ascii=False))
+    try:
+        if args.diff:
+            if args.cache:
+                base_resources = CachedPlanParser(args.diff, args.format).parse()
+                if select is not None:
+                    base_resources = filter(select, base_resources)
+                plan_diff = diff_plans(base_resources, resources)
+            else:
+                with open(args.diff, 'rb') as base_stream:
+                    plan_diff = diff_plans(open_plan_parser(base_stream, args.format, select)[1], resources)
+            plan_diff["base"] = args.diff
+            print(json.dumps(plan_diff, indent=2, ensure_ascii=False))
+        elif filtered and not args.ndjson:
+            risk_report = build_risk_report(parser, resources, args.only, args.types)
+            print(json.dumps(risk_report, indent=2, ensure_ascii=False))
+            if args.fail_on_match and risk_report["risks"]:
+                print(f"⚠️  {len(risk_report['risks'])} matching change(s) found", file=sys.stderr)
+                sys.exit(2)
+        elif args.ndjson:
+            write_plan_ndjson(parser, resources)
+        else:
+            # Output as formatted JSON
+            print(json.dumps(build_plan_data(parser, list(resources)), indent=2, ensure_ascii=False))
+    finally:
+        if stream is not None and stream is not sys.stdin.buffer:
+            stream.close()
 
 if __name__ == "__main__":
     main()
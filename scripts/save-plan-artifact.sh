@@ -24,7 +24,8 @@ fi
 echo "🔍 Processing plan output: $PLAN_OUTPUT_FILE"
 
 # Parse the plan output to JSON
-PARSED_JSON=$(python3 "$SCRIPT_DIR/parse-plan-output.py" "$PLAN_OUTPUT_FILE")
+# --cache reuses <plan>.parsed.ndjson when the same plan log is processed again (e.g. on retries)
+PARSED_JSON=$(python3 "$SCRIPT_DIR/parse-plan-output.py" --cache "$PLAN_OUTPUT_FILE")
 
 # Create artifacts directory if it doesn't exist
 mkdir -p artifacts
@@ -60,7 +61,7 @@ fi
 # Clean up raw plan file if requested
 if [[ "${CLEANUP_RAW:-false}" == "true" ]]; then
     echo "🧹 Cleaning up raw plan file: $PLAN_OUTPUT_FILE"
-    rm -f "$PLAN_OUTPUT_FILE"
+    rm -f "$PLAN_OUTPUT_FILE" "$PLAN_OUTPUT_FILE.parsed.ndjson"
 fi
 
 echo "✅ Plan processing complete"
@@ -0,0 +1,30 @@
+"""
+Import the scripts in this directory whose file names are not valid module
+names (parse-plan-output.py, track-ip-allocations.py, ...).
+"""
+
+import importlib.util
+import os
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(file_name: str):
+    """
+    Import scripts/<file_name> as e.g. parse_plan_output and register it in
+    sys.modules, so process pools can pickle its functions by module name.
+    A script that is already loaded is returned as is.
+    """
+    name = os.path.splitext(file_name)[0].replace('-', '_')
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPT_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
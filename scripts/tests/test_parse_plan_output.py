@@ -0,0 +1,68 @@
+"""Tests for parse-plan-output.py (run with `python -m pytest scripts/tests`)"""
+
+import json
+import os
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(SCRIPTS_DIR, "fixtures", "plans")
+FIXTURE = os.path.join(FIXTURE_DIR, "sensitive-values.plan.json")
+HEREDOC_FIXTURE = os.path.join(FIXTURE_DIR, "destroyed-heredoc.txt")
+SECRETS = ("old-secret", "new-secret", "nested-old", "nested-new", "created-secret", "label-secret", "deleted-secret")
+
+sys.path.insert(0, SCRIPTS_DIR)
+from script_loader import load_script  # noqa: E402
+
+
+def load_parser_module():
+    return load_script("parse-plan-output.py")
+
+
+def parse_fixture():
+    with open(FIXTURE, "rb") as stream:
+        return load_parser_module().parse_plan_stream(stream)
+
+
+def test_sensitive_attributes_are_masked():
+    resources = {r["address"]: r for r in parse_fixture()["resources"]}
+    text = json.dumps([r["attributes"] for r in resources.values()])
+    for secret in SECRETS:
+        assert secret not in text
+
+    user = resources["module.sql.google_sql_user.app"]["attributes"]
+    assert user["password"] == {"before": "(sensitive value)", "after": "(sensitive value)"}
+    version = resources["module.sql.google_secret_manager_secret_version.app"]["attributes"]
+    assert version["labels"] == {"owner": "platform", "token": "(sensitive value)"}
+
+
+def test_before_and_after_trees_are_masked():
+    for resource in parse_fixture()["resources"]:
+        text = json.dumps(resource)
+        for secret in SECRETS:
+            assert secret not in text
+
+    user = {r["address"]: r for r in parse_fixture()["resources"]}["module.sql.google_sql_user.app"]
+    assert user["after"]["password_policy"][0]["status"][0]["password"] == "(sensitive value)"
+    assert user["after"]["password_policy"][0]["allowed_failed_attempts"] == 5
+
+
+def test_destroyed_heredoc_closes_on_terminator_with_transition():
+    with open(HEREDOC_FIXTURE, "rb") as stream:
+        plan = load_parser_module().parse_plan_stream(stream)
+    assert plan["summary"]["to_destroy"] == 2
+    assert plan["summary"]["to_create"] == 1
+
+    resources = {r["address"]: r for r in plan["resources"]}
+    bucket = resources["google_storage_bucket.logs"]
+    assert bucket["attributes"]["policy"] == '{\n"bindings": []\n}'
+    assert bucket["before"]["policy"] == bucket["attributes"]["policy"]
+    assert resources["google_sql_database_instance.main"]["action"] == "destroy"
+    assert resources["google_storage_bucket.archive"]["attributes"]["policy"] == "{}"
+
+
+def test_risk_scan_sees_destroys_after_a_destroyed_heredoc():
+    with open(HEREDOC_FIXTURE, "rb") as stream:
+        report = load_parser_module().scan_plan_risks(stream, only="destructive")
+    assert [risk["address"] for risk in report["risks"]] == [
+        "google_storage_bucket.logs", "google_sql_database_instance.main"]
+    assert report["summary"]["to_create"] == 1
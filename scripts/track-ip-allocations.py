@@ -5,77 +5,298 @@ Tracks and validates IP allocations across the infrastructure
 """
 
 import os
+import re
 import sys
 import json
+import heapq
+import bisect
+import fnmatch
+import itertools
 import yaml
 import ipaddress
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from script_loader import load_script
+
+# Pattern for IPv4 addresses and CIDR blocks, and IPv6 CIDR blocks
+IP_PATTERN = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}(?:/\d{1,2})?\b'
+                        r'|(?<![\w:.])(?:[0-9a-fA-F]{0,4}:){2,7}[0-9a-fA-F]{0,4}/\d{1,3}\b')
+
+# Directories never scanned: Terragrunt/Terraform download caches and VCS metadata.
+# Directories named "example" are real units under live/, so they are not pruned by default.
+PRUNED_DIRS = ('.terragrunt-cache', '.terraform', '.git', 'node_modules')
+SCAN_CACHE_VERSION = 2
+
+# Mock and example addresses that are never allocations
+IGNORED_PREFIXES = ('1.2.3.', '0.0.0.0', '255.255.255.')
+
+# Loaded once per worker process by _init_renderer
+_config_renderer = None
+
+def load_config_renderer():
+    """Import tg-config-renderer.py, checking the parsers it needs are installed"""
+    try:
+        module = load_script("tg-config-renderer.py")
+    except SystemExit:
+        # The renderer exits at import time when python-hcl2 is missing
+        raise RuntimeError("tg-config-renderer requires python-hcl2 (pip3 install python-hcl2)")
+    if not module.Hcl2JsonParser.is_available():
+        raise RuntimeError("tg-config-renderer requires hcl2json on PATH for full rendering")
+    return module
+
+def _init_renderer():
+    global _config_renderer
+    _config_renderer = load_config_renderer()
+
+def render_unit_inputs(unit_dir: str, repo_root: str) -> Tuple[Optional[Dict], Optional[str]]:
+    """Render one unit's final inputs in a worker process; returns (result, error)"""
+    try:
+        renderer = _config_renderer.FullConfigRenderer(Path(unit_dir), Path(repo_root))
+        return renderer.render(), None
+    except Exception as e:
+        return None, str(e)
+
+def is_allocation_candidate(ip_str: str) -> bool:
+    """
+    Whether an IP_PATTERN match is a real address or CIDR block worth
+    tracking: it must parse, and mock addresses and default routes
+    (0.0.0.0/0, ::/0) are skipped.
+    """
+    if ip_str.startswith(IGNORED_PREFIXES):
+        return False
+    try:
+        network = ipaddress.ip_network(ip_str, strict=False)
+    except ValueError:
+        return False
+    return network.prefixlen > 0
+
+def iter_ip_values(value: Any, path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (input path, address) for every string in a rendered value that is
+    entirely an IP address or CIDR block, e.g. ('inputs.subnets[0].subnet_ip', '10.0.0.0/24').
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from iter_ip_values(item, f"{path}.{key}")
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from iter_ip_values(item, f"{path}[{index}]")
+    elif isinstance(value, str):
+        candidate = value.strip()
+        if IP_PATTERN.fullmatch(candidate) and is_allocation_candidate(candidate):
+            yield path, candidate
+
+def find_overlapping_pairs(ranges: Iterable[Tuple[int, int, int, int]]) -> List[Tuple[int, int]]:
+    """
+    Return (i, j) id pairs, i < j, of ranges that overlap.
+
+    Ranges are (version, start, end, id) with inclusive integer bounds, so
+    IPv4 and IPv6 never overlap each other. Sort-and-sweep: ranges are
+    visited by start while a heap holds the ones still open, so the cost
+    is O(n log n + k) for k overlapping pairs.
+    """
+    pairs = []
+    active = []
+    current_version = None
+    for version, start, end, range_id in sorted(ranges):
+        if version != current_version:
+            active, current_version = [], version
+        # Drop ranges that ended before this one starts
+        while active and active[0][0] < start:
+            heapq.heappop(active)
+        for _, other_id in active:
+            pairs.append((min(range_id, other_id), max(range_id, other_id)))
+        heapq.heappush(active, (end, range_id))
+    pairs.sort()
+    return pairs
 
 class IPAllocationTracker:
     """Track and validate IP allocations across Terragrunt configurations"""
 
-    def __init__(self, repo_root: str):
+    def __init__(self, repo_root: str, cache_file: Optional[str] = None, workers: int = 0,
+                 exclude: Iterable[str] = ()):
         self.repo_root = Path(repo_root)
+        self.cache_file = cache_file
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.pruned_dirs = (*PRUNED_DIRS, *exclude)
         self.allocations = defaultdict(list)
         self.conflicts = []
+        self.scan_stats = {}
+
+    def find_terragrunt_files(self) -> List[Path]:
+        """List terragrunt.hcl files, sorted, without descending into pruned directories"""
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.repo_root):
+            dirnames[:] = [
+                d for d in dirnames
+                if not any(fnmatch.fnmatch(d, pattern) for pattern in self.pruned_dirs)
+            ]
+            if 'terragrunt.hcl' in filenames:
+                files.append(Path(dirpath) / 'terragrunt.hcl')
+        return sorted(files)
 
     def scan_terragrunt_files(self):
-        """Scan all terragrunt.hcl files for IP allocations"""
-        for hcl_file in self.repo_root.rglob("terragrunt.hcl"):
-            self._parse_hcl_file(hcl_file)
+        """
+        Scan all terragrunt.hcl files for IP allocations.
+
+        Files are read and scanned in a thread pool. With a cache file,
+        per-file matches are reused while a file's mtime and size are
+        unchanged, so reruns only rescan files that changed.
+        """
+        cache = self._load_scan_cache()
+        results = {}
+        fresh = {}
+        pending = []
+        failed = 0
+        for file_path in self.find_terragrunt_files():
+            relative_path = str(file_path.relative_to(self.repo_root))
+            try:
+                stat = file_path.stat()
+            except OSError as e:
+                print(f"Error reading {file_path}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            entry = cache.get(relative_path)
+            if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                results[relative_path] = entry['matches']
+                fresh[relative_path] = entry
+            else:
+                pending.append((file_path, relative_path, stat))
+
+        cached = len(results)
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                scanned = pool.map(self._parse_hcl_file, [file_path for file_path, _, _ in pending])
+                for (_, relative_path, stat), matches in zip(pending, scanned):
+                    if matches is None:
+                        failed += 1
+                        continue
+                    results[relative_path] = matches
+                    fresh[relative_path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'matches': matches}
+
+        # Merge in path order so the report does not depend on thread scheduling
+        for relative_path in sorted(results):
+            for ip_str, line, context in results[relative_path]:
+                self.allocations[ip_str].append({
+                    'file': relative_path,
+                    'context': context,
+                    'line': line
+                })
+
+        self.scan_stats = {'files': len(results), 'rescanned': len(results) - cached, 'cached': cached,
+                           'failed': failed}
+        if self.cache_file:
+            # Only files that still exist are written back, so deleted files drop out
+            self._save_scan_cache(fresh)
+
+    def scan_rendered_configs(self):
+        """
+        Collect IP allocations from fully rendered unit configs instead of raw text.
+
+        Every unit under live/ is rendered with tg-config-renderer's
+        FullConfigRenderer in a process pool, so values inherited from
+        common.hcl, templates and include locals are seen and comments are
+        not. Allocations are keyed by input path (e.g.
+        `inputs.subnets[0].subnet_ip`) and attributed to the file the
+        top-level input came from. Rendered results depend on many files,
+        so the per-file scan cache is not used here.
+        """
+        units = sorted(
+            hcl_file.parent for hcl_file in self.find_terragrunt_files()
+            if hcl_file.relative_to(self.repo_root).parts[:1] == ('live',)
+        )
+        repo_root = str(self.repo_root.resolve())
+        failed = 0
+        with ProcessPoolExecutor(max_workers=min(self.workers, os.cpu_count() or 1),
+                                 initializer=_init_renderer) as pool:
+            rendered = pool.map(render_unit_inputs, [str(unit.resolve()) for unit in units],
+                                [repo_root] * len(units), chunksize=8)
+            for unit, (result, error) in zip(units, rendered):
+                unit_file = str((unit / 'terragrunt.hcl').relative_to(self.repo_root))
+                if error is not None:
+                    print(f"Error rendering {unit_file}: {error}", file=sys.stderr)
+                    failed += 1
+                    continue
+                sources = result.get('sources', {})
+                for input_path, ip_str in iter_ip_values(result.get('inputs', {}), 'inputs'):
+                    top_key = input_path.split('.', 2)[1].split('[', 1)[0]
+                    self.allocations[ip_str].append({
+                        'file': sources.get(top_key) or unit_file,
+                        'unit': str(unit.relative_to(self.repo_root)),
+                        'context': input_path,
+                        'line': None
+                    })
+
+        self.scan_stats = {'files': len(units) - failed, 'rescanned': len(units) - failed, 'cached': 0,
+                           'failed': failed}
 
-    def _parse_hcl_file(self, file_path: Path):
-        """Parse a terragrunt.hcl file for IP addresses and CIDR blocks"""
+    def _load_scan_cache(self) -> Dict[str, Dict]:
+        """Load per-file scan results, or an empty cache if missing or from another version"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable scan cache {self.cache_file}: {e}", file=sys.stderr)
+            return {}
+        if cache.get('version') != SCAN_CACHE_VERSION:
+            return {}
+        return cache.get('files', {})
+
+    def _save_scan_cache(self, files: Dict[str, Dict]):
+        """Write the scan cache atomically"""
+        tmp_path = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': SCAN_CACHE_VERSION, 'files': files}, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"Warning: could not write scan cache {self.cache_file}: {e}", file=sys.stderr)
+
+    def _parse_hcl_file(self, file_path: Path) -> Optional[List[List]]:
+        """
+        Parse a terragrunt.hcl file for IP addresses and CIDR blocks.
+
+        Returns [ip, line, context] entries, or None if the file could not be read.
+        """
         try:
             with open(file_path, 'r') as f:
                 content = f.read()
 
-            # Extract IP addresses and CIDR blocks
-            import re
+            # Offset of the first character of every line, for bisecting match positions
+            lines = content.split('\n')
+            line_starts = [0, *itertools.accumulate(len(line) + 1 for line in lines[:-1])]
+            matches = []
 
-            # Pattern for IP addresses and CIDR blocks
-            ip_pattern = r'\b(?:\d{1,3}\.){3}\d{1,3}(?:/\d{1,2})?\b'
-
-            for match in re.finditer(ip_pattern, content):
+            for match in IP_PATTERN.finditer(content):
                 ip_str = match.group()
 
-                # Skip mock IPs and examples
-                if ip_str.startswith(('1.2.3.', '0.0.0.0', '255.255.255.')):
+                # Skip mock IPs, default routes and look-alikes that do not parse
+                if not is_allocation_candidate(ip_str):
                     continue
 
-                # Determine the context
-                context = self._get_context(content, match.start())
+                line_index = bisect.bisect_right(line_starts, match.start()) - 1
+                matches.append([ip_str, line_index + 1, self._get_context(lines[line_index])])
 
-                # Store the allocation
-                self.allocations[ip_str].append({
-                    'file': str(file_path.relative_to(self.repo_root)),
-                    'context': context,
-                    'line': content[:match.start()].count('\n') + 1
-                })
+            return matches
 
         except Exception as e:
             print(f"Error parsing {file_path}: {e}", file=sys.stderr)
-
-    def _get_context(self, content: str, position: int) -> str:
-        """Get the context around an IP address match"""
-        # Find the line containing the match
-        lines = content.split('\n')
-        current_pos = 0
-
-        for i, line in enumerate(lines):
-            if current_pos <= position < current_pos + len(line) + 1:
-                # Return the variable or key name if found
-                if '=' in line:
-                    return line.split('=')[0].strip()
-                elif ':' in line:
-                    return line.split(':')[0].strip()
-                else:
-                    return line.strip()[:50]  # First 50 chars of the line
-            current_pos += len(line) + 1
-
-        return "unknown"
+            return None
+
+    def _get_context(self, line: str) -> str:
+        """Get the context of an IP address match from the line containing it"""
+        # Return the variable or key name if found
+        if '=' in line:
+            return line.split('=')[0].strip()
+        elif ':' in line:
+            return line.split(':')[0].strip()
+        else:
+            return line.strip()[:50]  # First 50 chars of the line
 
     def check_overlaps(self):
         """Check for overlapping CIDR blocks"""
@@ -89,17 +310,21 @@ class IPAllocationTracker:
                 except ValueError:
                     continue
 
-        # Check for overlaps
-        for i, (net1, str1, loc1) in enumerate(networks):
-            for net2, str2, loc2 in networks[i+1:]:
-                if net1.overlaps(net2) and str1 != str2:
-                    self.conflicts.append({
-                        'type': 'overlap',
-                        'network1': str1,
-                        'network2': str2,
-                        'locations1': loc1,
-                        'locations2': loc2
-                    })
+        # Sweep integer ranges instead of comparing every pair of networks
+        ranges = [
+            (network.version, int(network.network_address), int(network.broadcast_address), i)
+            for i, (network, _, _) in enumerate(networks)
+        ]
+        for i, j in find_overlapping_pairs(ranges):
+            _, str1, loc1 = networks[i]
+            _, str2, loc2 = networks[j]
+            self.conflicts.append({
+                'type': 'overlap',
+                'network1': str1,
+                'network2': str2,
+                'locations1': loc1,
+                'locations2': loc2
+            })
 
     def generate_report(self) -> Dict:
         """Generate an IP allocation report"""
@@ -125,7 +350,8 @@ class IPAllocationTracker:
                 {
                     'file': loc['file'],
                     'line': loc['line'],
-                    'context': loc['context']
+                    'context': loc['context'],
+                    **({'unit': loc['unit']} if 'unit' in loc else {})
                 }
                 for loc in locations
             ]
@@ -151,7 +377,7 @@ class IPAllocationTracker:
             for cidr, locations in sorted(report['allocations']['cidr'].items()):
                 print(f"\n  {cidr}:")
                 for loc in locations:
-                    print(f"    - {loc['file']}:{loc['line']} ({loc['context']})")
+                    print(f"    - {self._format_location(loc)} ({loc['context']})")
 
         # Individual IPs
         if 'ip' in report['allocations']:
@@ -159,7 +385,7 @@ class IPAllocationTracker:
             for ip, locations in sorted(report['allocations']['ip'].items()):
                 print(f"\n  {ip}:")
                 for loc in locations:
-                    print(f"    - {loc['file']}:{loc['line']} ({loc['context']})")
+                    print(f"    - {self._format_location(loc)} ({loc['context']})")
 
         # Conflicts
         if report['conflicts']:
@@ -169,13 +395,20 @@ class IPAllocationTracker:
                 print(f"\n  Type: {conflict['type']}")
                 print(f"  Network 1: {conflict['network1']}")
                 for loc in conflict['locations1']:
-                    print(f"    - {loc['file']}:{loc['line']}")
+                    print(f"    - {self._format_location(loc)}")
                 print(f"  Network 2: {conflict['network2']}")
                 for loc in conflict['locations2']:
-                    print(f"    - {loc['file']}:{loc['line']}")
+                    print(f"    - {self._format_location(loc)}")
 
         print("\n" + "="*80)
 
+    @staticmethod
+    def _format_location(loc: Dict) -> str:
+        """`file:line` for text scans; rendered allocations have no line, so name the unit instead"""
+        if loc.get('line') is None:
+            return f"{loc['file']} [{loc.get('unit', '')}]"
+        return f"{loc['file']}:{loc['line']}"
+
     def save_report(self, report: Dict, output_file: str):
         """Save report to a JSON file"""
         with open(output_file, 'w') as f:
@@ -190,15 +423,35 @@ def main():
     parser.add_argument('--repo-root', default='.', help='Repository root directory')
     parser.add_argument('--output', help='Output file for JSON report')
     parser.add_argument('--check-only', action='store_true', help='Only check for conflicts')
+    parser.add_argument('--cache', help='Per-file scan cache; unchanged files (same mtime and size) are not rescanned')
+    parser.add_argument('--jobs', type=int, default=0, help='Scanner threads (default: 4 per CPU, max 32)')
+    parser.add_argument('--rendered', action='store_true',
+                        help='Extract IPs from fully rendered unit configs (tg-config-renderer) instead of raw text')
+    parser.add_argument('--exclude', nargs='+', default=[], metavar='DIR_PATTERN',
+                        help=f"Extra directory name patterns to skip (always skipped: {', '.join(PRUNED_DIRS)})")
 
     args = parser.parse_args()
 
     # Initialize tracker
-    tracker = IPAllocationTracker(args.repo_root)
+    tracker = IPAllocationTracker(args.repo_root, cache_file=args.cache, workers=args.jobs, exclude=args.exclude)
 
     # Scan files
-    print("Scanning Terragrunt files for IP allocations...")
-    tracker.scan_terragrunt_files()
+    if args.rendered:
+        print("Rendering Terragrunt units for IP allocations...")
+        try:
+            load_config_renderer()
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        tracker.scan_rendered_configs()
+        failed = tracker.scan_stats['failed']
+        print(f"Rendered {tracker.scan_stats['files']} units" + (f" ({failed} failed)" if failed else ""))
+    else:
+        print("Scanning Terragrunt files for IP allocations...")
+        tracker.scan_terragrunt_files()
+        stats = tracker.scan_stats
+        failed = f", {stats['failed']} failed" if stats['failed'] else ""
+        print(f"Scanned {stats['files']} files ({stats['rescanned']} rescanned, {stats['cached']} from cache{failed})")
 
     # Check for overlaps
     print("Checking for overlapping CIDR blocks...")